@@ -0,0 +1,67 @@
+######################################################################################################################
+# Import libraries
+######################################################################################################################
+import os
+import subprocess
+import sys
+
+# This script measures the time to import myUtilities and each of its submodules, each in a new Python process, and
+# checks that myUtilities, myETL, myImpute and myWindows do not import the heavy dependencies.
+# Usage: python bench_import.py [number of runs]
+# Exits with status 1 if a module imports a dependency it should not.
+
+######################################################################################################################
+# Private Parameters
+######################################################################################################################
+
+_MODULES_ = ['myUtilities', 'myETL', 'myImpute', 'myWindows', 'myTransformers', 'myGenerators', 'myCallbacks']
+
+# Dependencies which must not be imported by each module.
+_HEAVY_DEPENDENCIES_ = ['keras', 'tensorflow', 'matplotlib', 'sklearn']
+_FORBIDDEN_IMPORTS_ = {
+    'myUtilities': _HEAVY_DEPENDENCIES_ + ['pandas'],
+    'myETL': _HEAVY_DEPENDENCIES_,
+    'myImpute': _HEAVY_DEPENDENCIES_,
+    'myWindows': _HEAVY_DEPENDENCIES_ + ['pandas']
+}
+
+_IMPORT_SCRIPT_ = '''
+import sys, time
+start = time.perf_counter()
+import %s
+print(time.perf_counter() - start)
+print(' '.join(sorted(set(name.split('.')[0] for name in sys.modules))))
+'''
+
+
+######################################################################################################################
+# Private Functions
+######################################################################################################################
+# This function imports the module in a new Python process.
+# Returns [import time in seconds, set of the top level modules imported].
+def _time_import_(module_name):
+    output = subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT_ % module_name],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)), universal_newlines=True)
+    elapsed, imported = output.strip().split('\n')[-2:]
+    return [float(elapsed), set(imported.split())]
+
+
+def _main_(num_runs):
+    failed = False
+    print('%-16s %10s  %s' % ('module', 'seconds', 'heavy dependencies imported'))
+    for module_name in _MODULES_:
+        times = []
+        for _ in range(num_runs):
+            elapsed, imported = _time_import_(module_name)
+            times.append(elapsed)
+        heavy_imports = sorted(imported & set(_HEAVY_DEPENDENCIES_ + ['pandas']))
+        forbidden_imports = sorted(imported & set(_FORBIDDEN_IMPORTS_.get(module_name, [])))
+        print('%-16s %10.3f  %s' % (module_name, sorted(times)[num_runs // 2], ' '.join(heavy_imports)))
+        if forbidden_imports:
+            print('  %s must not import %s' % (module_name, ' '.join(forbidden_imports)))
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main_(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
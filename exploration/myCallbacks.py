@@ -0,0 +1,349 @@
+######################################################################################################################
+# Import libraries
+######################################################################################################################
+import os
+import threading
+import numpy as np
+from keras.callbacks import Callback
+from keras import backend as K
+from myWindows import MASK_VALUE, get_contiguous_batches, _attach_data_, _floatx_, _max_delay_, _window_view_, \
+    _gather_windows_
+
+######################################################################################################################
+# Private Parameters
+######################################################################################################################
+
+# Metrics calculated by ValidationScoreCb(eval_mode='predict') from the targets and predictions. Each metric returns
+# [sum, count] so that it can be accumulated over batches; the metric is sum / count.
+_NUMPY_METRICS_ = {
+    'mae': lambda y, y_pred: [np.sum(np.abs(y_pred - y), dtype='float64'), np.size(y)],
+    'mean_absolute_error': lambda y, y_pred: [np.sum(np.abs(y_pred - y), dtype='float64'), np.size(y)],
+    'mse': lambda y, y_pred: [np.sum(np.square(y_pred - y), dtype='float64'), np.size(y)],
+    'mean_squared_error': lambda y, y_pred: [np.sum(np.square(y_pred - y), dtype='float64'), np.size(y)],
+    'masked_mae': lambda y, y_pred: _masked_sum_(np.abs(y_pred - y), y),
+    'masked_mse': lambda y, y_pred: _masked_sum_(np.square(y_pred - y), y)
+}
+
+# File of the best weights saved by ValidationScoreCb.
+_BEST_WEIGHTS_FILE_ = 'weights-best.h5'
+
+
+######################################################################################################################
+# Public Functions
+######################################################################################################################
+
+
+#
+class ResetStateCb(Callback):
+    def __init__(self, gen):
+        self.gen = gen
+        super(ResetStateCb, self).__init__()
+
+    def on_batch_begin(self, batch, logs={}):
+        if not self.gen.__seq_from_last_batch__(batch):
+            # print('reset state for batch %d' % batch)
+            self.model.reset_states()
+
+
+# This callback resets the states of the lanes which start a new sequence in a batch of a
+# DataGeneratorForStateFulRNN(lanes=True); the states of the other lanes are kept. The states of each stateful layer
+# are set to 0 in the rows of those lanes.
+class LaneResetCb(Callback):
+    def __init__(self, gen):
+        self.gen = gen
+        super(LaneResetCb, self).__init__()
+
+    def on_batch_begin(self, batch, logs={}):
+        reset_mask = self.gen.__lane_reset_mask__(batch)
+        if not reset_mask.any():
+            return
+        for layer in self.model.layers:
+            if not getattr(layer, 'stateful', False):
+                continue
+            for state in layer.states:
+                value = K.get_value(state)
+                value[reset_mask] = 0
+                K.set_value(state, value)
+
+
+# This function returns a keras loss which ignores the targets which are MASK_VALUE, for the (batch, horizons) targets
+# of a generator with a sequence of horizons as delay. loss is 'mae' or 'mse'. The loss of a sample is the mean over
+# its horizons with an output. ValidationScoreCb(eval_mode='predict') calculates the same loss in numpy.
+def masked_loss(loss='mae'):
+    if loss not in ['mae', 'mse']:
+        raise ValueError('Unknown loss %s. Expected mae or mse.' % loss)
+
+    def masked_mae(y_true, y_pred):
+        mask = K.cast(K.not_equal(y_true, MASK_VALUE), K.dtype(y_pred))
+        return K.sum(K.abs(y_pred - y_true) * mask, axis=-1) / K.maximum(K.sum(mask, axis=-1), 1)
+
+    def masked_mse(y_true, y_pred):
+        mask = K.cast(K.not_equal(y_true, MASK_VALUE), K.dtype(y_pred))
+        return K.sum(K.square(y_pred - y_true) * mask, axis=-1) / K.maximum(K.sum(mask, axis=-1), 1)
+
+    if loss == 'mae':
+        return masked_mae
+    return masked_mse
+
+
+# This callback calculates the validation score and save the best model.
+class ValidationScoreCb(Callback):
+
+    # def __init__(self, gen, callbacks):
+    #     self.gen = gen
+    #     self.callbacks = callbacks
+    #     self.history = {'val_loss': [], 'val_acc': []}
+    #     super(ValidationScoreCb, self).__init__()
+
+    # If lazy is True, only the row ranges of the batches of contiguous samples are kept; the samples of each batch
+    # are created when the batch is evaluated (see get_contiguous_batches).
+    # cache is passed to get_contiguous_batches.
+    # eval_mode='evaluate' calls evaluate() for each batch of contiguous samples. eval_mode='predict' calls predict()
+    # once for all the batches and calculates the metrics in numpy (see _NUMPY_METRICS_); it falls back to evaluate()
+    # if a metric is not supported. The numpy loss does not include any regularization losses. If lazy is True,
+    # eval_mode='predict' calls predict() for each batch of contiguous samples and accumulates the metrics, so that
+    # only 1 batch of samples is in memory at a time.
+    # If delay is a sequence of horizons, eval_mode='predict' also records the metrics of each horizon d as
+    # val_<metric>_h<d>, calculated over the samples with an output at that horizon.
+    # If background_save is True, weights-best.h5 is written by a background thread so that the next epoch is not
+    # blocked: the weights are copied to numpy arrays at the end of the epoch and the thread writes the copy. A new
+    # file replaces the previous file in one step, and the last write is waited for at the end of training.
+    # dtype is the dtype of the samples and targets (the keras floatx if None).
+    def __init__(self, data, lookback, delay, min_index, max_index, batch_size=128, step=6, verbose=0,
+                 save_model = False, monitor='val_loss', lazy=False, eval_mode='evaluate', background_save=False,
+                 dtype=None, cache=False):
+        data = _attach_data_(data)
+        if max_index is None:
+            self.max_index = len(data) - _max_delay_(delay) - 1
+        else:
+            self.max_index = max_index - _max_delay_(delay)
+        self.min_index = min_index
+        self.data = data
+        self.lookback, self.delay = lookback, delay
+        self.batch_size, self.step = batch_size, step
+        self.verbose = verbose
+        self.batch_list = []
+        self.history = {}
+        self.save_model = save_model
+        self.monitor = monitor
+        self.eval_mode = eval_mode
+        self.lazy = lazy
+        self.background_save = background_save
+        self.save_thread = None
+        self.dtype = _floatx_(dtype)
+
+        self.batch_list, self.rows_list = get_contiguous_batches(data, lookback, delay, min_index,
+                                                                 max_index, batch_size, step, lazy=lazy,
+                                                                 dtype=self.dtype, cache=cache)
+
+        # Select a batch starting from lookback;
+        # Note that max_index had already been reduced to account for delay.
+        # Need to exclude the samples which have missing output i.e. output = MASK_VALUE
+        # batch_start_idx = self.min_index + self.lookback
+        # batch_end_idx = batch_start_idx
+        # remaining_samples = True
+        # while remaining_samples:
+        #     not_na = True
+        #     # search for the next missing value
+        #     while remaining_samples and not_na:
+        #
+        #         if data[batch_end_idx, 0] == MASK_VALUE:
+        #             not_na = False
+        #         else:
+        #             # continue search with next sample
+        #             if batch_end_idx < self.max_index:
+        #                 batch_end_idx += 1
+        #             else:
+        #                 # no more data
+        #                 remaining_samples = False
+        #
+        #     # Add samples found into the batch if greater than batch size.
+        #     if batch_end_idx > batch_start_idx + self.batch_size:
+        #
+        #         resid = (batch_end_idx - batch_start_idx) % self.batch_size
+        #         rows = np.arange(batch_start_idx, batch_end_idx - resid).tolist()
+        #         samples = np.zeros((len(rows),
+        #                             self.lookback // self.step,
+        #                             self.data.shape[-1]))
+        #         # Each value in targets is a training label at t+delay.
+        #         targets = np.zeros((len(rows),))
+        #
+        #         for j, row in enumerate(rows):
+        #             indices = np.arange(rows[j] - self.lookback, rows[j], self.step)
+        #             samples[j] = self.data[indices]
+        #             # samples[j] = self.data[(rows[j] - self.lookback):rows[j]]
+        #             targets[j] = self.data[rows[j] + self.delay][0]
+        #
+        #         self.batch_list.append([samples, targets])
+        #         batch_start_idx = batch_end_idx + 1
+        #
+        #     # look for the next good value
+        #     if remaining_samples:
+        #         # Skip all the nan
+        #         while data[batch_end_idx, 0] == MASK_VALUE:
+        #             batch_end_idx += 1
+        #         # Restart from this good value
+        #         batch_start_idx = batch_end_idx
+
+        super(ValidationScoreCb, self).__init__()
+
+
+    # initialise history of metrics
+    def on_train_begin(self, logs=None):
+        for metric in self.model.metrics_names:
+            self.history['val_' + metric] = []
+            if (self.eval_mode == 'predict') and (np.ndim(self.delay) > 0):
+                for d in self.delay:
+                    self.history['val_%s_h%d' % (metric, d)] = []
+
+
+    def on_epoch_end(self, epoch, logs=None):
+
+        # results = self.model.evaluate_generator(generator = self.gen, callbacks=self.callbacks,
+        #                                         workers=3, use_multiprocessing=False, verbose=0)
+        # for idx, metric in enumerate(self.model.metrics_names):
+        #     self.history['val_' + metric].append(results[idx])
+
+        if self.eval_mode == 'predict':
+            results = self._predict_metrics_()
+            if results is not None:
+                results, horizon_results = results
+                for metric, result, h_results in zip(self.model.metrics_names, results, horizon_results):
+                    self.history['val_' + metric].append(result)
+                    for d, h_result in h_results:
+                        self.history['val_%s_h%d' % (metric, d)].append(h_result)
+                self._save_best_weights_()
+                return
+
+        # Evaluate each batch of contiguous samples.
+        # In lazy mode, the samples of each batch are created when it is evaluated.
+        results = []
+        batch_sizes = []
+        num_samples = 0
+        for a_batch in self.batch_list:
+            results.append(self.model.evaluate(a_batch[0], a_batch[1], batch_size=self.batch_size, verbose=0))
+            batch_sizes.append(a_batch[0].shape[0])
+            num_samples += a_batch[0].shape[0]
+
+        # Calculate the average metrics over the batches
+        for idx, metric in enumerate(self.model.metrics_names):
+            sum_weighted_metric = 0
+            for i, res in enumerate(results):  # results is a list of scalar metrics for each batch
+                sum_weighted_metric += res[idx] * batch_sizes[i]  # sum the metrics weighted by batch size
+
+            # Calculate the average metric score
+            self.history['val_' + metric].append(sum_weighted_metric / num_samples)
+
+        # Save model
+        self._save_best_weights_()
+        # if (self.save_model > 0) and (not (epoch % 25)):
+        #     self.model.save_weights(
+        #         'weights-epoch{:4d}-val_loss{:.2f}'.format(epoch, self.history['val_loss'][-1]) + '.h5')
+
+    # Wait for the background write of the best weights.
+    def on_train_end(self, logs=None):
+        self._wait_for_save_()
+
+    # Save the weights if the latest score is the best score.
+    def _save_best_weights_(self):
+        if min(self.history[self.monitor]) == self.history[self.monitor][-1]:
+            if self.background_save:
+                # The previous write is finished first so that the files are written in order.
+                self._wait_for_save_()
+                self.save_thread = threading.Thread(target=_write_weights_file_,
+                                                    args=(_BEST_WEIGHTS_FILE_,) + _get_layer_weights_(self.model))
+                self.save_thread.start()
+            else:
+                self.model.save_weights(_BEST_WEIGHTS_FILE_)
+
+    def _wait_for_save_(self):
+        if self.save_thread is not None:
+            self.save_thread.join()
+            self.save_thread = None
+
+    # Predict all the batches of contiguous samples at once (1 batch at a time if lazy is True) and calculate the
+    # metrics.
+    # Returns [metrics, horizon_metrics], or None if a metric is not supported. metrics is the list of metrics in the
+    # order of model.metrics_names and horizon_metrics is a list of [horizon, metric] for each metric; it is empty for
+    # a single delay.
+    def _predict_metrics_(self):
+        metric_funcs = []
+        for metric in self.model.metrics_names:
+            if metric == 'loss':
+                metric = self.model.loss if isinstance(self.model.loss, str) else self.model.loss.__name__
+            if metric not in _NUMPY_METRICS_:
+                return None
+            metric_funcs.append(_NUMPY_METRICS_[metric])
+
+        if len(self.rows_list) == 0:
+            return None
+        if self.lazy:
+            rows_list = [np.array(rows) for rows in self.rows_list]
+        else:
+            rows_list = [np.concatenate([np.array(rows) for rows in self.rows_list])]
+        horizons = list(self.delay) if np.ndim(self.delay) > 0 else []
+
+        # [sum, count] of each metric, and of each metric and horizon
+        sums = np.zeros((len(metric_funcs), 2))
+        horizon_sums = np.zeros((len(metric_funcs), len(horizons), 2))
+        windows = _window_view_(self.data, self.lookback, self.step)
+        for rows in rows_list:
+            samples, targets = _gather_windows_(self.data, windows, rows, self.lookback, self.delay, self.dtype)
+            predictions = self.model.predict(samples, batch_size=self.batch_size).reshape(targets.shape)
+            for i, func in enumerate(metric_funcs):
+                sums[i] += func(targets, predictions)
+                for h in range(len(horizons)):
+                    has_output = targets[:, h] != MASK_VALUE
+                    horizon_sums[i, h] += func(targets[has_output, h], predictions[has_output, h])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            results = (sums[:, 0] / sums[:, 1]).tolist()
+            horizon_results = [[[d, h_sum / h_count] for d, (h_sum, h_count) in zip(horizons, h_sums)]
+                               for h_sums in horizon_sums]
+        return [results, horizon_results]
+
+
+######################################################################################################################
+# Private Functions
+######################################################################################################################
+# This function returns [sum, count] of the mean errors of the samples over the targets which are not MASK_VALUE, like
+# the loss of masked_loss (see _NUMPY_METRICS_).
+def _masked_sum_(errors, y):
+    errors, mask = errors.reshape(len(y), -1), (y != MASK_VALUE).reshape(len(y), -1)
+    return [np.sum((errors * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1), dtype='float64'), len(y)]
+
+
+# This function returns ([[layer name, [weight names], [weight values]], ...], keras version, backend) of a model for
+# _write_weights_file_. The values are numpy copies, so the weights can be written while the model is trained.
+def _get_layer_weights_(model):
+    import keras
+    layers = model.layers
+    values = K.batch_get_value([w for layer in layers for w in layer.weights])
+    layer_weights = []
+    i = 0
+    for layer in layers:
+        names = [w.name if getattr(w, 'name', None) else 'param_%d' % j for j, w in enumerate(layer.weights)]
+        layer_weights.append([layer.name, names, values[i:i + len(names)]])
+        i += len(names)
+    return (layer_weights, keras.__version__, K.backend())
+
+
+# This function writes the weights of the layers (see _get_layer_weights_) to a HDF5 file in the layout of keras
+# save_weights, so that the file can be loaded with load_weights. The strings are stored as fixed-length bytes, which
+# are read back as bytes with any h5py version. The weights are written to a temporary file which then replaces the
+# file in one step; an interrupted write never leaves a partial file.
+def _write_weights_file_(file_name, layer_weights, keras_version, backend):
+    # h5py is a dependency of keras save_weights.
+    import h5py
+    temp_file_name = '%s.%d.tmp' % (file_name, os.getpid())
+    with h5py.File(temp_file_name, 'w') as h5_file:
+        h5_file.attrs['layer_names'] = np.array([name.encode('utf8') for name, _, _ in layer_weights], dtype='S')
+        h5_file.attrs['backend'] = np.bytes_(backend.encode('utf8'))
+        h5_file.attrs['keras_version'] = np.bytes_(str(keras_version).encode('utf8'))
+        for layer_name, names, values in layer_weights:
+            group = h5_file.create_group(layer_name)
+            group.attrs['weight_names'] = np.array([name.encode('utf8') for name in names], dtype='S')
+            for name, value in zip(names, values):
+                group.create_dataset(name, data=value)
+    os.replace(temp_file_name, file_name)
+    return None
@@ -0,0 +1,1266 @@
+######################################################################################################################
+# Import libraries
+######################################################################################################################
+import os
+import pandas as pd
+import re
+import datetime
+import math
+import numpy as np
+from pandas.tseries.offsets import MonthBegin, MonthEnd
+import json
+import time
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from myImpute import impute_gaps, evaluate_imputation
+
+######################################################################################################################
+# Private Parameters
+######################################################################################################################
+
+# directories
+_RAW_DATA_PATH_ = os.path.join('source', '105 building data')
+_COMBINED_DATA_PATH_ = os.path.join('source', 'combined_bldg_data')
+_PROCESSED_DATA_PATH_ = os.path.join('source', 'processed_bldg_data')
+_IMPUTED_TRAIN_DATA_PATH_ = os.path.join('source', 'imputed_bldg_data', 'train')
+_IMPUTED_TEST_DATA_PATH_ = os.path.join('source', 'imputed_bldg_data', 'test')
+_MISC_DATA_PATH_ = os.path.join('source', 'other_data')
+
+# files
+_MSG_LOG_FILE_ = os.path.join('source', 'log', 'logfile.txt')
+_BLDG_PWM_FORMULAE_FILE_ = os.path.join(_MISC_DATA_PATH_, 'bldg-PWM-formulae.json')
+_BLDG_BTU_FORMULAE_FILE_ = os.path.join(_MISC_DATA_PATH_, 'bldg-BTU-formulae.json')
+_RAW_FILE_CATALOG_FILE_ = os.path.join(_MISC_DATA_PATH_, 'raw-file-catalog.json')
+
+# Data input conversion utilities
+_DATA_TYPE_TO_PATH_ = {
+    'raw': _RAW_DATA_PATH_,
+    'combined': _COMBINED_DATA_PATH_,
+    'processed': _PROCESSED_DATA_PATH_,
+    'imputed_train': _IMPUTED_TRAIN_DATA_PATH_,
+    'imputed_test': _IMPUTED_TEST_DATA_PATH_
+}
+
+# Storage formats for the combined, processed and imputed data. The file extension is the name of the format.
+_STORAGE_FORMATS_ = ['csv', 'parquet', 'feather']
+_DEFAULT_STORAGE_FORMAT_ = 'csv'
+
+_MONTH_TO_NUM_ = {
+    'Jan': 1,
+    'Feb': 2,
+    'Mar': 3,
+    'Apr': 4,
+    'May': 5,
+    'Jun': 6,
+    'Jul': 7,
+    'Aug': 8,
+    'Sep': 9,
+    'Oct': 10,
+    'Nov': 11,
+    'Dec': 12
+}
+
+# Messages buffered by a worker process of process_bldgs_in_parallel. None if messages are written to the log directly.
+_MSG_BUFFER_ = None
+
+# Data frames cached by load_data_by_bldg(cache=True), from the least to the most recently used.
+# {(name, data_type, data path, storage format, columns): [file size, file mtime, memory size, data frame]}
+_DF_CACHE_ = OrderedDict()
+# Maximum total memory size in bytes of the cached data frames (see set_load_data_cache).
+_DF_CACHE_MAX_SIZE_ = 2 * 1024 ** 3
+
+# Aggregation formulae for PWM and BTU for each building. None until they are read from the formulae files (see
+# _get_bldg_formulae_).
+_PWM_FORMULA_ = None
+_BTU_FORMULA_ = None
+
+
+######################################################################################################################
+# Public Functions
+######################################################################################################################
+
+
+# This function returns a list of raw data files by building name, month and year in the path.
+def get_num_files_by_bldg_mth(data_path=_RAW_DATA_PATH_):
+
+    file_list = []
+    for bldg_name, bldg_files in get_raw_file_catalog(data_path).items():
+        for year, month, file_path, file_size, file_mtime in bldg_files:
+            file_list.append([bldg_name, year, month, file_size])
+
+    return file_list
+
+
+# This function returns the catalog of raw data files in the path as a dictionary
+# {bldg name: [[year, month, file path, file size, file mtime], ...]} sorted by year and month.
+# The directory listings are kept in catalog_file and only the directories whose mtime changed since the last call
+# are listed again. Note that a file overwritten in place does not change the mtime of its directory.
+def get_raw_file_catalog(data_path=_RAW_DATA_PATH_, catalog_file=_RAW_FILE_CATALOG_FILE_):
+
+    catalog = _read_json_file_(catalog_file)
+    if catalog is None:
+        catalog = {}
+
+    # Refresh the directory listings of the path.
+    catalog_key = os.path.abspath(data_path)
+    old_dir_dict = catalog.get(catalog_key, {})
+    dir_dict = {}
+    _scan_raw_dir_(data_path, '', old_dir_dict, dir_dict)
+    if dir_dict != old_dir_dict:
+        catalog[catalog_key] = dir_dict
+        _write_json_file_(catalog, catalog_file)
+
+    bldg_file_dict = {}
+    for rel_dir, dir_entry in dir_dict.items():
+        if len(dir_entry['files']) > 0:
+            # Get the month and year from the containing folder name e.g. Jul_2015
+            dir_name = os.path.basename(os.path.join(data_path, rel_dir).rstrip(os.path.sep))
+            month = _MONTH_TO_NUM_[dir_name.split('_')[0]]
+            year = int(dir_name.split('_')[1])
+
+            for afile, file_size, file_mtime in dir_entry['files']:
+                bldg_name = afile.split('_')[0]
+                bldg_file_dict.setdefault(bldg_name, []).append(
+                    [year, month, os.path.join(data_path, rel_dir, afile), file_size, file_mtime])
+
+    for bldg_files in bldg_file_dict.values():
+        bldg_files.sort()
+
+    return bldg_file_dict
+
+
+# This function loads the time series data for a list of building names. data_type is defined in _DATA_TYPE_TO_PATH_.
+# It returns a list of [[name, data frame], ...]
+# If data_type='raw', building list must have only 1 building.
+# storage_format is one of _STORAGE_FORMATS_. columns is a list of the columns to read (all columns if None); the
+# parquet and feather formats only read the requested columns from the file.
+# If cache is True, the data frames are kept in memory and the file is only read again if its size or modification
+# time has changed (see set_load_data_cache). Each call returns a copy of the cached data frame, so it can be modified
+# without changing the cache; the copy is a lazy copy-on-write copy if pandas copy_on_write mode is enabled.
+def load_data_by_bldg(bldg_name_list, data_type, data_path=None, storage_format=_DEFAULT_STORAGE_FORMAT_,
+                      columns=None, cache=False):
+
+    bldg_df_list = []
+
+    if data_type == 'raw':
+        if data_path is None:
+            bldg_df_list = _load_data_by_bldg_(bldg_name_list[0])
+        else:
+            bldg_df_list = _load_data_by_bldg_(bldg_name_list[0], data_path=data_path)
+    # data_type is 'combined' or 'processed' or 'imputed_train' or 'imputed_test'
+    else:
+        if data_path is None:
+            data_path = _DATA_TYPE_TO_PATH_[data_type]
+        # load all files
+        if bldg_name_list == 'all':
+            bldg_name_list = _get_bldg_names_(data_path, storage_format)
+        # load files in specified building name list
+        for i in bldg_name_list:
+            if cache:
+                df = _read_cached_bldg_df_(i, data_type, data_path, storage_format, columns)
+            else:
+                df = _read_bldg_df_(_bldg_file_path_(data_path, i, storage_format), storage_format, columns)
+            bldg_df_list.append([i, df])
+
+    return bldg_df_list
+
+
+# This function converts the data files of a list of building names (or 'all') from one storage format to another
+# e.g. to export parquet files to csv. data_type is defined in _DATA_TYPE_TO_PATH_. The converted files are written
+# to the same path unless output_data_path is given.
+def convert_data_by_bldg(bldg_name_list, data_type, from_format, to_format, data_path=None, output_data_path=None):
+
+    if data_path is None:
+        data_path = _DATA_TYPE_TO_PATH_[data_type]
+    if output_data_path is None:
+        output_data_path = data_path
+
+    for name, df in load_data_by_bldg(bldg_name_list, data_type, data_path, storage_format=from_format):
+        _write_bldg_df_(df, _bldg_file_path_(output_data_path, name, to_format), to_format)
+
+    return None
+
+
+# This function aggregates the raw time series PWM data for a building in the path according to the building's PWM
+# formula.
+# name is a list of building names or 'all'; errors are logged to _MSG_LOG_FILE_
+# input_format and output_format are the storage formats of the combined and processed data (see _STORAGE_FORMATS_).
+# If incremental is True, only the time periods after the last time period in the processed data file are processed
+# and appended to the file. The whole history is processed again if the processed data is not consistent with the
+# combined data (e.g. new meters or data added to months already processed).
+# The outliers of the aggregate data of each prefix in outlier_prefixes ('PWM', 'BTU') are removed with an IQR rule
+# (see _mask_outliers_): the quartiles are calculated over the whole history if outlier_window is None, else over a
+# trailing rolling window e.g. '30D' which only needs the last window of the processed data in incremental mode.
+# If chunked is True, each building is processed 1 month at a time from the combined data file read in chunks of
+# chunk_rows rows, so that the whole history is never in memory (see _process_bldg_chunked_). The output is the same
+# as without chunked. chunked cannot be combined with incremental.
+# Returns True if at least 1 building data is written to a file.
+def process_data_by_bldg(bldg_name_list, input_data_path=_COMBINED_DATA_PATH_, output_data_path=_PROCESSED_DATA_PATH_,
+                         input_format=_DEFAULT_STORAGE_FORMAT_, output_format=_DEFAULT_STORAGE_FORMAT_,
+                         incremental=False, outlier_prefixes=('BTU',), outlier_k=3.0, outlier_window=None,
+                         chunked=False, chunk_rows=100000):
+
+    result = False
+    if chunked:
+        if incremental:
+            raise ValueError('The chunked and incremental modes cannot be combined.')
+        if bldg_name_list == 'all':
+            bldg_name_list = _get_bldg_names_(input_data_path, input_format)
+        for name in bldg_name_list:
+            if _process_bldg_chunked_(name, input_data_path, output_data_path, input_format, output_format,
+                                      outlier_prefixes, outlier_k, outlier_window, chunk_rows):
+                result = True
+        return result
+
+    bldg_df_list = load_data_by_bldg(bldg_name_list, 'combined', input_data_path, storage_format=input_format)
+
+    for name, df in bldg_df_list:
+
+        output_file = _bldg_file_path_(output_data_path, name, output_format)
+        processed_df = None
+        is_padded = False
+        if incremental and os.path.isfile(output_file):
+            processed_df = _read_bldg_df_(output_file, output_format)
+            if _is_appendable_(df, processed_df):
+                # The processed data is padded with empty time periods to the end of the month. Only the time periods
+                # up to the last meter data are kept; the padding is processed again with the new data.
+                last_period = _get_last_meter_period_(processed_df, df.columns)
+                if df.index.max() <= last_period:
+                    # no new data
+                    continue
+                is_padded = processed_df.index.max() > last_period
+                processed_df = processed_df[processed_df.index <= last_period]
+            else:
+                processed_df = None
+
+        # Reindex the cumulative data to add any missing time periods. This is needed for differencing.
+        if processed_df is None:
+            start = df.index.min() - MonthBegin(n=1)  # set to first day of month
+            start = start.replace(hour=0, minute=0)  # set time to 00h00
+        else:
+            # Start from the last processed time period. This boundary row is needed for differencing.
+            start = processed_df.index.max()
+            df = df[df.index >= start]
+        end = df.index.max() + MonthEnd(n=1)  # set to last day of month
+        end = end.replace(hour=23, minute=30)  # set time to 23h30
+        df = reindex_ts_df(df, start, end)
+
+        df, pwm_formula_err, btu_formula_err, num_negative_btu = _aggregate_bldg_df_(name, df)
+        _log_negative_btu_(num_negative_btu, name)
+
+        if pwm_formula_err and btu_formula_err:
+            pass
+        else:
+            if processed_df is not None:
+                # Remove the boundary row which had already been processed.
+                df = df.iloc[1:]
+                if list(df.columns) != list(processed_df.columns):
+                    # The formula results differ from the processed data; process the whole history.
+                    if process_data_by_bldg([name], input_data_path, output_data_path, input_format, output_format,
+                                            outlier_prefixes=outlier_prefixes, outlier_k=outlier_k,
+                                            outlier_window=outlier_window):
+                        result = True
+                    continue
+
+            # Remove outliers. In incremental mode, the quartiles are calculated over the processed history (already
+            # without outliers) and the new data.
+            for prefix, formula_err in [['PWM', pwm_formula_err], ['BTU', btu_formula_err]]:
+                if formula_err or (prefix not in outlier_prefixes):
+                    continue
+                col = prefix + '_30min_avg'
+                history = None if processed_df is None else processed_df[col]
+                df[col], num_outliers = _mask_outliers_(df[col], outlier_k, outlier_window, history)
+                if num_outliers > 0:
+                    _write_msg_log_('%d %s outliers removed in %s' % (num_outliers, prefix, name),
+                                    log=_MSG_LOG_FILE_)
+            # Save to file
+            if processed_df is None:
+                _write_bldg_df_(df, output_file, output_format)
+            elif is_padded:
+                _write_bldg_df_(pd.concat([processed_df, df]), output_file, output_format)
+            else:
+                _append_bldg_df_(df, output_file, output_format)
+            result = True
+
+    return result
+
+
+# This function imputes the gaps of the processed data of a list of buildings (or 'all') and writes the training data
+# to train_data_path and the validation / test data to test_data_path, like ETL10.impute.struct.RMD. The training data
+# is from the first PWM value to train_end and the validation / test data is from test_start to test_end; each dataset
+# is imputed on its own.
+# The columns (if in the data) are imputed with impute_gaps (see myImpute) with the method and max_gap: the gaps of
+# more than max_gap periods are left missing.
+# The 'kalman' method is a local level model, not the StructTS model of R: the imputed values differ from the R tiers
+# (e.g. by about .3 kW on the AS5 gap printed in ETL10.impute.struct.md), so check them with compare_imputed_data
+# before using them in place of the R tiers.
+# input_format and output_format are the storage formats of the processed and imputed data (see _STORAGE_FORMATS_).
+# Returns True if at least 1 building data is written to a file.
+def impute_data_by_bldg(bldg_name_list, input_data_path=_PROCESSED_DATA_PATH_,
+                        train_data_path=_IMPUTED_TRAIN_DATA_PATH_, test_data_path=_IMPUTED_TEST_DATA_PATH_,
+                        input_format=_DEFAULT_STORAGE_FORMAT_, output_format=_DEFAULT_STORAGE_FORMAT_,
+                        columns=('PWM_30min_avg', 'BTU_30min_avg'),
+                        method='kalman', max_gap=3, train_end='2017-03-31 23:30', test_start='2018-01-01 00:00',
+                        test_end='2018-11-30 23:30'):
+
+    result = False
+    for name, df in load_data_by_bldg(bldg_name_list, 'processed', input_data_path, storage_format=input_format):
+
+        if 'PWM_30min_avg' not in df.columns or df['PWM_30min_avg'].count() == 0:
+            _write_msg_log_('No PWM data to impute in %s' % name, log=_MSG_LOG_FILE_)
+            continue
+        impute_cols = [col for col in columns if col in df.columns]
+        train_start = df['PWM_30min_avg'].first_valid_index()
+
+        for start, end, output_data_path in [[train_start, train_end, train_data_path],
+                                             [test_start, test_end, test_data_path]]:
+            tier_df = df.loc[start:end].copy()
+            if tier_df.empty:
+                _write_msg_log_('No data from %s to %s to impute in %s' % (start, end, name), log=_MSG_LOG_FILE_)
+                continue
+            # All the columns are imputed at once.
+            tier_df[impute_cols] = impute_gaps(tier_df[impute_cols].values, method=method, max_gap=max_gap)
+            _write_bldg_df_(tier_df, _bldg_file_path_(output_data_path, name, output_format), output_format)
+            result = True
+
+    return result
+
+
+# This function compares the imputed data of a list of buildings written by impute_data_by_bldg with the imputed data
+# written by ETL10.impute.struct.RMD (<name>_train_imputed.csv and <name>_valtest_imputed.csv in r_data_path).
+# The imputed values are the values of the columns which are missing in the processed data.
+# Returns a data frame with a row for each building, dataset ('train' or 'test') and column: the number of values
+# imputed by both, by this package only and by R only, and the RMSE and maximum absolute difference of the values
+# imputed by both.
+def compare_imputed_data(bldg_name_list, r_data_path, columns=('PWM_30min_avg', 'BTU_30min_avg'),
+                         input_data_path=_PROCESSED_DATA_PATH_, train_data_path=_IMPUTED_TRAIN_DATA_PATH_,
+                         test_data_path=_IMPUTED_TEST_DATA_PATH_, storage_format=_DEFAULT_STORAGE_FORMAT_):
+
+    rows = []
+    for name, processed_df in load_data_by_bldg(bldg_name_list, 'processed', input_data_path,
+                                                storage_format=storage_format):
+        for dataset, data_path, r_file_suffix in [['train', train_data_path, '_train_imputed.csv'],
+                                                  ['test', test_data_path, '_valtest_imputed.csv']]:
+            df = _read_bldg_df_(_bldg_file_path_(data_path, name, storage_format), storage_format)
+            r_df = pd.read_csv(os.path.join(r_data_path, name + r_file_suffix), index_col=0, parse_dates=True)
+            r_df.sort_index(inplace=True)
+            index = df.index.intersection(r_df.index)
+            for col in columns:
+                if col not in df.columns or col not in r_df.columns:
+                    continue
+                was_missing = processed_df[col].reindex(index).isnull().values
+                values = df.loc[index, col].values
+                r_values = r_df.loc[index, col].values
+                imputed = was_missing & ~np.isnan(values)
+                r_imputed = was_missing & ~np.isnan(r_values)
+                diff = values[imputed & r_imputed] - r_values[imputed & r_imputed]
+                rows.append([name, dataset, col, int((imputed & r_imputed).sum()), int((imputed & ~r_imputed).sum()),
+                             int((~imputed & r_imputed).sum()),
+                             np.sqrt(np.mean(diff ** 2)) if len(diff) else np.nan,
+                             np.abs(diff).max() if len(diff) else np.nan])
+
+    return pd.DataFrame(rows, columns=['name', 'dataset', 'column', 'num_imputed_both', 'num_imputed_only',
+                                       'num_imputed_r_only', 'rmse', 'max_abs_diff'])
+
+
+# This function benchmarks imputation methods (see myImpute) on the processed data of a list of buildings (or 'all'),
+# like the ETL6.impute.sim and ETL7.impute.eval notebooks: missing data is simulated in the num_blocks largest blocks of
+# the column without missing values, num_trials times for each rate (number of gaps per value) and gap size, and each
+# method imputes the simulated missing data (see evaluate_imputation). Each building, block, rate and gap size is run in
+# a separate task of a pool of worker processes; max_workers=None uses the number of processors. seed makes the
+# simulated missing data reproducible.
+# Returns a data frame with a row for each building, method, gap size and rate: the number of trials, the mean fraction
+# of missing values and the mean and standard deviation of the RMSE of the trials of all the blocks.
+def benchmark_imputation_by_bldg(bldg_name_list, methods=('kalman', 'ma', 'linear'), rates=(.05, .1, .15, .2, .25),
+                                 gap_sizes=(2, 3, 4, 5, 7, 9, 14, 23), num_blocks=10, num_trials=100,
+                                 column='PWM_30min_avg', input_data_path=_PROCESSED_DATA_PATH_,
+                                 storage_format=_DEFAULT_STORAGE_FORMAT_, max_workers=None, seed=729):
+
+    tasks = []
+    for name, df in load_data_by_bldg(bldg_name_list, 'processed', input_data_path, storage_format=storage_format,
+                                      columns=[column]):
+        values = df[column].values
+        for start, size in _get_value_blocks_(values, num_blocks):
+            for rate in rates:
+                for gap_size in gap_sizes:
+                    tasks.append([name, rate, gap_size, values[start:start + size]])
+
+    results = []
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(evaluate_imputation, block, rate, gap_size, num_trials, methods, task_seed)
+                   for (name, rate, gap_size, block), task_seed in zip(tasks, seeds)]
+        for (name, rate, gap_size, block), future in zip(tasks, futures):
+            missing_fractions, rmse = future.result()
+            for method, method_rmse in zip(methods, rmse):
+                results.append(pd.DataFrame({'name': name, 'method': method, 'gap_size': gap_size, 'rate': rate,
+                                             'missing_fraction': missing_fractions, 'rmse': method_rmse}))
+
+    columns = ['name', 'method', 'gap_size', 'rate', 'num_trials', 'missing_fraction', 'rmse_mean', 'rmse_std']
+    if not results:
+        return pd.DataFrame(columns=columns)
+    result_df = pd.concat(results, ignore_index=True)
+    result_df = result_df.groupby(['name', 'method', 'gap_size', 'rate'], sort=False).agg(
+        num_trials=('rmse', 'count'), missing_fraction=('missing_fraction', 'mean'), rmse_mean=('rmse', 'mean'),
+        rmse_std=('rmse', 'std')).reset_index()
+    return result_df[columns]
+
+
+# This function runs combine_csv_files_by_bldg (task='combine'), process_data_by_bldg (task='process') or
+# impute_data_by_bldg (task='impute') for a list of building names or 'all' in parallel. Each building is run in a
+# separate worker process; max_workers=None uses the number of processors. Messages logged by the workers are written
+# to the log files after all buildings are done, in the order of the building list.
+# Returns a list of [[name, status, elapsed seconds], ...] in the order of the building list. Status is 'done',
+# 'no output' (no file written by process_data_by_bldg or impute_data_by_bldg) or 'error'.
+# input_format and output_format are the storage formats (see _STORAGE_FORMATS_); the raw data is always csv.
+# incremental is passed to combine_csv_files_by_bldg or process_data_by_bldg.
+# process_kwargs is a dict of other keyword arguments of process_data_by_bldg e.g. {'outlier_window': '30D'} or of
+# impute_data_by_bldg e.g. {'method': 'ma'}. For task='impute', output_data_path is not used; the output paths are
+# the train_data_path and test_data_path of impute_data_by_bldg.
+def process_bldgs_in_parallel(bldg_name_list, task='process', max_workers=None, input_data_path=None,
+                              output_data_path=None, input_format=_DEFAULT_STORAGE_FORMAT_,
+                              output_format=_DEFAULT_STORAGE_FORMAT_, incremental=False, process_kwargs=None):
+
+    if task == 'combine':
+        input_data_path = _RAW_DATA_PATH_ if input_data_path is None else input_data_path
+        output_data_path = _COMBINED_DATA_PATH_ if output_data_path is None else output_data_path
+        # Refresh the raw file catalog once before the workers read it.
+        raw_file_catalog = get_raw_file_catalog(input_data_path)
+        if bldg_name_list == 'all':
+            bldg_name_list = sorted(raw_file_catalog.keys())
+    elif task == 'impute':
+        input_data_path = _PROCESSED_DATA_PATH_ if input_data_path is None else input_data_path
+        if bldg_name_list == 'all':
+            bldg_name_list = _get_bldg_names_(input_data_path, input_format)
+    else:
+        input_data_path = _COMBINED_DATA_PATH_ if input_data_path is None else input_data_path
+        output_data_path = _PROCESSED_DATA_PATH_ if output_data_path is None else output_data_path
+        if bldg_name_list == 'all':
+            bldg_name_list = _get_bldg_names_(input_data_path, input_format)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_run_bldg_task_, task, name, input_data_path, output_data_path, input_format,
+                                   output_format, incremental, process_kwargs) for name in bldg_name_list]
+        for name, future in zip(bldg_name_list, futures):
+            try:
+                results.append(future.result())
+            except Exception as err:
+                # the worker process failed e.g. terminated abruptly
+                results.append([name, 'error', 0., [[_MSG_LOG_FILE_, datetime.datetime.now().strftime(
+                    "%Y-%m-%d %H:%M:%S") + ' %s %s failed: %r\n' % (task, name, err)]]])
+
+    for name, status, elapsed, msg_list in results:
+        _write_buffered_msg_log_(msg_list)
+
+    return [[name, status, elapsed] for name, status, elapsed, msg_list in results]
+
+
+# This function checks if date/time field in the time series data is encoded day first. Returns False if
+# time_series_data is null.
+def is_day_first(file_name, time_series_data):
+
+    result = False
+    ambiguous = True
+    mmmyyyy = file_name.split('.')[0].split('_')[1]
+    mmm = re.search('[A-Z][a-z]{2}', mmmyyyy)[0]
+
+    # Extract the month from the filename.
+    month = _MONTH_TO_NUM_[mmm]
+    if not time_series_data.empty:
+
+        # Look for the first date in which the first or second number differ from the month. That number is the day.
+        # Get the first 2 numbers of the date field of all the rows; the rows without them (e.g. a missing date) are
+        # ignored.
+        date_nums = time_series_data.iloc[:, 0].astype('str').str.extract(r'^\s*(\d+)/(\d+)').astype('float')
+        date_nums = date_nums.dropna()
+        first_num_differs = (date_nums[0] != month).values
+        num_differs = first_num_differs | (date_nums[1] != month).values
+        if num_differs.any():
+            ambiguous = False
+            # Day first if the first number differs, else month first.
+            result = bool(first_num_differs[num_differs.argmax()])
+
+    return result, ambiguous
+
+
+# This function combines all the raw time series PWM data in separate csv files into one csv file for a building.
+# It also performs date/time and string to numeric conversions.
+# output_format is the storage format of the combined data (see _STORAGE_FORMATS_).
+# The raw files combined are recorded (by path, size and mtime) in a manifest file <name>.manifest.json. If incremental
+# is True, only the raw files which are not in the manifest are combined and appended to the combined data file. All
+# the raw files are combined again if a raw file in the manifest had been changed or removed.
+def combine_csv_files_by_bldg(name, input_data_path=_RAW_DATA_PATH_, output_data_path=_COMBINED_DATA_PATH_,
+                              output_format=_DEFAULT_STORAGE_FORMAT_, incremental=False):
+
+    output_file = _bldg_file_path_(output_data_path, name, output_format)
+    manifest_file = os.path.join(output_data_path, name + '.manifest.json')
+    # The size and mtime of each raw file of the building are read again, as the catalog does not detect a file
+    # overwritten in place.
+    raw_files = []
+    for year, month, file_path, file_size, file_mtime in get_raw_file_catalog(input_data_path).get(name, []):
+        file_stat = os.stat(file_path)
+        raw_files.append([file_path, file_stat.st_size, file_stat.st_mtime])
+
+    # Get the raw files which had not been combined.
+    combined_files = None
+    if incremental and os.path.isfile(output_file):
+        combined_files = _read_json_file_(manifest_file)
+        if (combined_files is not None) and any([i not in raw_files for i in combined_files]):
+            combined_files = None
+    if combined_files is None:
+        file_paths = None
+    else:
+        file_paths = [i[0] for i in raw_files if i not in combined_files]
+        if not file_paths:
+            # no new data
+            return None
+
+    # MISSING_DATA_RATIO = .95
+    bldg_data_list = _load_data_by_bldg_(name, input_data_path, parse_numbers=True, file_paths=file_paths)
+
+    # Perform pre-processing for all the dataframes in the list.
+    for i in bldg_data_list:
+        if not i[3].empty:
+
+            # Convert the date/time.
+            day_first, unclear = is_day_first(i[0], i[3])
+            if unclear:
+                # Log error message
+                _write_msg_log_(i[0] + 'date format unclear.', log=output_data_path+'/logfile.txt')
+
+            i[3]['Pt_timeStamp'] = _parse_timestamps_(i[3]['Pt_timeStamp'], day_first)
+
+            # The strings had been converted to floats when the files were read.
+
+            ####################################
+            # Add any other pre-processing here.
+            ####################################
+
+        # Remove whitespaces and dashes from the column names, even for empty data frames.
+        new_col_name_list = []
+        for j in i[3].columns:
+            new_col_name_list.append(re.sub('[ -]', '', j))
+        i[3].columns = new_col_name_list
+
+    # Concatenate the list of dataframes into 1 single dataframe.
+    df_list = []
+    for i in bldg_data_list:
+        df_list.append(i[3])
+
+    if df_list:  # not empty list
+
+        # Concatenate the dataframes in the list.
+        bldg_data_df = pd.concat(df_list)
+
+        # After concatenation, pandas sorts the columns by lexico order. Change Pt_Timestamp to first position.
+        pt_ts_col_idx = bldg_data_df.columns.get_loc('Pt_timeStamp')
+        cols = bldg_data_df.columns.tolist()
+        cols = cols[pt_ts_col_idx:pt_ts_col_idx+1] + cols[:pt_ts_col_idx] + cols[pt_ts_col_idx+1:]
+        bldg_data_df = bldg_data_df[cols]
+
+        # Save the dataframe indexed by Pt_timeStamp. Do not write row names (i.e. index 0,1,2,3,4,...)
+        if combined_files is None:
+            _write_bldg_df_(bldg_data_df.set_index('Pt_timeStamp'), output_file, output_format)
+        else:
+            _append_bldg_df_(bldg_data_df.set_index('Pt_timeStamp'), output_file, output_format)
+        _write_json_file_(raw_files, manifest_file)
+    else:
+        # Log error message.
+        _write_msg_log_(name + ' has no data.', log=os.path.join(output_data_path, 'logfile.txt'))
+
+    return None
+
+
+# This function plots the cumulative time series data for up to ten buildings.
+# bldg_df_list is a list of [[bldg name, data frame]]
+def plot_pwm_upto10_bldgs(bldg_df_list):
+    # matplotlib is only imported when plotting.
+    import matplotlib.pyplot as plt
+
+    nrows = math.ceil(len(bldg_df_list)/2)
+    height = nrows * 4
+    no_more_plots = False
+
+    fig, ax = plt.subplots(nrows=nrows, ncols=2, figsize=(20, height))
+    # list_idx = 0
+    for row_idx, row in enumerate(ax):
+        for col_idx, col in enumerate(row):
+            if not no_more_plots:
+                # Read the csv file which has all the cumulative time series data for a building.
+                # a_bldg_df = pd.read_csv(data_path + '/' + bldg_list[list_idx] + '.csv', index_col=0, parse_dates=True)
+
+                # Get the PWM related column names
+                a_bldg_pwm_columns = []
+                # Index of the building name and dataframe list
+                bldg_idx = row_idx * len(row) + col_idx
+
+                # Get the column names in the data frame related to PWM
+                for i in bldg_df_list[bldg_idx][1].columns:
+                    if 'PWM' in i:
+                        a_bldg_pwm_columns.append(i)
+
+                # Plot the time series data.
+                col.plot(bldg_df_list[bldg_idx][1].loc[:, a_bldg_pwm_columns])
+                col.set_title(bldg_df_list[bldg_idx][0]+' PWM over 2015-2018')
+
+                # If more than 10 PWM columns plotted, don't show the legend (no space).
+                if len(a_bldg_pwm_columns) < 10:
+                    col.legend(bldg_df_list[bldg_idx][1].loc[:, a_bldg_pwm_columns])
+
+                if bldg_idx >= len(bldg_df_list) - 1:
+                    no_more_plots = True
+            else:
+                col.axis('off')
+    plt.show()
+    return None
+
+
+# This function re-indexes a time series data frame by filling in missing 30 min periods for a date range.
+# e.g. start='5/2015' or datetime
+def reindex_ts_df(ts_df, start, end):
+    # Copy the data frame.
+    # df = ts_df.copy()
+    df = ts_df
+    idx_name = df.index.name
+
+    # Reindex the dataframe using the year/month/day/time, add NaN values for any period with no data.
+    all_dates = pd.date_range(start, end, freq='30min')
+    df = df.reindex(all_dates)
+    df.sort_index(inplace=True)
+    df.index.name = idx_name
+
+    return df
+
+
+# This function sets the maximum total memory size in bytes of the data frames cached by load_data_by_bldg(cache=True)
+# and removes the least recently used data frames until the cache is within the size. max_size=0 clears the cache.
+def set_load_data_cache(max_size):
+    global _DF_CACHE_MAX_SIZE_
+    _DF_CACHE_MAX_SIZE_ = max_size
+    _evict_cached_bldg_dfs_()
+    return None
+
+
+# This function reads the log file.
+def read_msg_log(log=_MSG_LOG_FILE_):
+
+    messages = None
+    try:
+        with open(log, 'r') as logfile:
+            messages = logfile.read()
+    except IOError:
+        pass
+    return messages
+
+
+######################################################################################################################
+# Private Functions
+######################################################################################################################
+# This function writes an error message to the message log.
+# In a worker process of process_bldgs_in_parallel, the message is buffered and written to the log by the parent.
+def _write_msg_log_(msg, log=_MSG_LOG_FILE_):
+    line = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ' ' + msg + '\n'
+    if _MSG_BUFFER_ is not None:
+        _MSG_BUFFER_.append([log, line])
+    else:
+        logfile = open(log, 'a')
+        logfile.write(line)
+        logfile.close()
+    return None
+
+
+# This function writes a list of buffered [log, message line] to the message logs in the order given.
+def _write_buffered_msg_log_(msg_list):
+    for log, line in msg_list:
+        logfile = open(log, 'a')
+        logfile.write(line)
+        logfile.close()
+    return None
+
+
+# This function returns the list of building names with a data file of the storage format in the path.
+def _get_bldg_names_(data_path, storage_format=_DEFAULT_STORAGE_FORMAT_):
+    return sorted([i[:-len(storage_format) - 1] for i in os.listdir(data_path) if i.endswith('.' + storage_format)])
+
+
+# This function returns the path of the data file of a building in the storage format.
+def _bldg_file_path_(data_path, name, storage_format):
+    if storage_format not in _STORAGE_FORMATS_:
+        raise ValueError('Unknown storage format %s' % storage_format)
+    return os.path.join(data_path, name + '.' + storage_format)
+
+
+# This function reads the time series data of a building from a file in the storage format. It returns a data frame
+# indexed by the time stamps in the first column, sorted by time. columns is a list of the columns to read (all
+# columns if None).
+def _read_bldg_df_(file_path, storage_format, columns=None):
+    if storage_format == 'parquet':
+        # The index is stored in the parquet metadata and is always read.
+        df = pd.read_parquet(file_path, columns=columns)
+    elif storage_format == 'feather':
+        # Feather does not store the index; it is written as the first column.
+        from pyarrow import feather
+        table = feather.read_table(file_path, memory_map=True)
+        if columns is not None:
+            table = table.select([table.column_names[0]] + list(columns))
+        df = table.to_pandas()
+        df.set_index(df.columns[0], inplace=True)
+    else:
+        if columns is None:
+            usecols = None
+        else:
+            usecols = [pd.read_csv(file_path, nrows=0).columns[0]] + list(columns)
+        df = pd.read_csv(file_path, index_col=0, parse_dates=True, usecols=usecols)
+        if columns is not None:
+            df = df[list(columns)]
+    df.sort_index(inplace=True)
+    return df
+
+
+# This function returns a copy of the data frame of a building from the cache of load_data_by_bldg. The file is read
+# into the cache if it is not cached or if its size or modification time differs from the cached data frame.
+def _read_cached_bldg_df_(name, data_type, data_path, storage_format, columns):
+    file_path = _bldg_file_path_(data_path, name, storage_format)
+    key = (name, data_type, os.path.abspath(data_path), storage_format, None if columns is None else tuple(columns))
+    file_stat = os.stat(file_path)
+    cached = _DF_CACHE_.get(key)
+    if (cached is not None) and (cached[0] == file_stat.st_size) and (cached[1] == file_stat.st_mtime):
+        _DF_CACHE_.move_to_end(key)
+        df = cached[3]
+    else:
+        df = _read_bldg_df_(file_path, storage_format, columns)
+        _DF_CACHE_[key] = [file_stat.st_size, file_stat.st_mtime, int(df.memory_usage(index=True, deep=True).sum()),
+                           df]
+        _DF_CACHE_.move_to_end(key)
+        _evict_cached_bldg_dfs_()
+
+    try:
+        copy_on_write = pd.get_option('mode.copy_on_write')
+    except (KeyError, AttributeError):
+        # pandas without copy_on_write mode
+        copy_on_write = False
+    return df.copy(deep=not copy_on_write)
+
+
+# This function removes the least recently used data frames from the cache of load_data_by_bldg until the total memory
+# size of the cached data frames is within _DF_CACHE_MAX_SIZE_.
+def _evict_cached_bldg_dfs_():
+    cache_size = sum([cached[2] for cached in _DF_CACHE_.values()])
+    while _DF_CACHE_ and (cache_size > _DF_CACHE_MAX_SIZE_):
+        key, cached = _DF_CACHE_.popitem(last=False)
+        cache_size -= cached[2]
+    return None
+
+
+# This function appends the time series data of a building to the data file in the storage format. Only the csv
+# format is appended in place (if the columns are the same); the other formats are written again with the data.
+def _append_bldg_df_(df, file_path, storage_format):
+    if storage_format == 'csv':
+        if list(pd.read_csv(file_path, index_col=0, nrows=0).columns) == list(df.columns):
+            df.to_csv(file_path, mode='a', header=False)
+            return None
+    _write_bldg_df_(pd.concat([_read_bldg_df_(file_path, storage_format), df]), file_path, storage_format)
+    return None
+
+
+# This function checks if the combined data of a building (df) can be processed incrementally i.e. the processed data
+# has the same meters and the same cumulative data up to the last processed time period.
+def _is_appendable_(df, processed_df):
+    meter_columns = list(processed_df.columns[:len(df.columns)])
+    if meter_columns != list(df.columns):
+        return False
+    last_period = _get_last_meter_period_(processed_df, meter_columns)
+    if pd.isnull(last_period):
+        return False
+    return df[df.index <= last_period].count().sum() == processed_df[meter_columns].count().sum()
+
+
+# This function returns the last time period of the processed data of a building with meter data i.e. the last time
+# period of the combined data processed before (NaT if there is no meter data).
+def _get_last_meter_period_(processed_df, meter_columns):
+    return processed_df[list(meter_columns)].dropna(how='all').index.max()
+
+
+# This function writes the time series data of a building to a file in the storage format.
+def _write_bldg_df_(df, file_path, storage_format):
+    if storage_format == 'parquet':
+        df.to_parquet(file_path)
+    elif storage_format == 'feather':
+        df.reset_index().to_feather(file_path)
+    else:
+        df.to_csv(file_path)
+    return None
+
+
+# This function runs 1 task of process_bldgs_in_parallel for a building in a worker process.
+# Returns [name, status, elapsed seconds, buffered messages]. Status is 'done', 'no output' or 'error'.
+def _run_bldg_task_(task, name, input_data_path, output_data_path, input_format, output_format, incremental,
+                    process_kwargs=None):
+    global _MSG_BUFFER_
+    _MSG_BUFFER_ = []
+    start = time.time()
+    try:
+        if task == 'combine':
+            combine_csv_files_by_bldg(name, input_data_path, output_data_path, output_format, incremental)
+            status = 'done'
+        elif task == 'impute':
+            status = 'done' if impute_data_by_bldg([name], input_data_path, input_format=input_format,
+                                                   output_format=output_format,
+                                                   **(process_kwargs or {})) else 'no output'
+        else:
+            status = 'done' if process_data_by_bldg([name], input_data_path, output_data_path, input_format,
+                                                    output_format, incremental,
+                                                    **(process_kwargs or {})) else 'no output'
+    except Exception as err:
+        _write_msg_log_('%s %s failed: %r' % (task, name, err), log=_MSG_LOG_FILE_)
+        status = 'error'
+    msg_list = _MSG_BUFFER_
+    _MSG_BUFFER_ = None
+    return [name, status, time.time() - start, msg_list]
+
+
+# This function returns the num_blocks largest blocks of consecutive values without NaN of an array as a list of
+# [[start row, size], ...], largest first.
+def _get_value_blocks_(values, num_blocks):
+    has_value = np.concatenate([[False], ~np.isnan(values), [False]])
+    edges = np.flatnonzero(np.diff(has_value.astype('int8')))
+    starts, ends = edges[::2], edges[1::2]
+    order = np.argsort(starts - ends, kind='stable')[:num_blocks]
+    return [[int(starts[i]), int(ends[i] - starts[i])] for i in order]
+
+
+# This function returns the raw time series data for a building in the path.
+# If parse_numbers is True, the values (all columns except the first date/time column) are read as floats with ','
+# as the thousands separator; otherwise they are read as in the files.
+# file_paths is a list of the raw files to read (all the raw files of the building if None).
+def _load_data_by_bldg_(name, data_path=_RAW_DATA_PATH_, parse_numbers=False, file_paths=None):
+
+    file_list = []
+    for year, month, file_path, file_size, file_mtime in get_raw_file_catalog(data_path).get(name, []):
+        if (file_paths is not None) and (file_path not in file_paths):
+            continue
+        if parse_numbers:
+            columns = pd.read_csv(file_path, nrows=0).columns
+            dtypes = dict([(j, 'float') for j in columns[1:]])
+            dtypes[columns[0]] = 'str'
+            df = pd.read_csv(file_path, thousands=',', dtype=dtypes)
+        else:
+            df = pd.read_csv(file_path)
+        file_list.append([os.path.basename(file_path), year, month, df])
+    return file_list
+
+
+# This function converts date/time strings e.g. 31/07/2015 23:30 to datetime. The common formats are parsed with an
+# explicit format; any other format falls back to the slower inferred parsing.
+def _parse_timestamps_(timestamps, day_first):
+    if day_first:
+        formats = ['%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S']
+    else:
+        formats = ['%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S']
+    for date_format in formats:
+        try:
+            return pd.to_datetime(timestamps, format=date_format)
+        except ValueError:
+            pass
+    return pd.to_datetime(timestamps, dayfirst=day_first)
+
+
+# This function lists a directory of the raw data path (rel_dir relative to data_path) and its sub-directories into
+# dir_dict as {rel_dir: {'mtime': mtime, 'subdirs': [names], 'files': [[name, size, mtime], ...]}}.
+# The listing in old_dir_dict is reused if the mtime of the directory is unchanged.
+def _scan_raw_dir_(data_path, rel_dir, old_dir_dict, dir_dict):
+
+    dir_path = os.path.join(data_path, rel_dir)
+    dir_mtime = os.stat(dir_path).st_mtime
+    dir_entry = old_dir_dict.get(rel_dir)
+    if dir_entry is None or dir_entry['mtime'] != dir_mtime:
+        subdirs, files = [], []
+        for entry in os.scandir(dir_path):
+            if entry.is_dir():
+                subdirs.append(entry.name)
+            else:
+                file_stat = entry.stat()
+                files.append([entry.name, file_stat.st_size, file_stat.st_mtime])
+        dir_entry = {'mtime': dir_mtime, 'subdirs': sorted(subdirs), 'files': sorted(files)}
+
+    dir_dict[rel_dir] = dir_entry
+    for subdir in dir_entry['subdirs']:
+        _scan_raw_dir_(data_path, os.path.join(rel_dir, subdir), old_dir_dict, dir_dict)
+    return None
+
+
+# This function reads an object from a json file. Returns None if the file does not exist or is not valid.
+def _read_json_file_(file_name):
+    try:
+        with open(file_name) as json_file:
+            return json.load(json_file)
+    except (IOError, ValueError):
+        return None
+
+
+# This function writes an object to a json file. The file is replaced in one step so that concurrent readers never
+# see a partially written file.
+def _write_json_file_(obj, file_name):
+    temp_file_name = '%s.%d.tmp' % (file_name, os.getpid())
+    try:
+        with open(temp_file_name, 'w') as json_file:
+            json.dump(obj, json_file)
+        os.replace(temp_file_name, file_name)
+    except IOError:
+        # the file is only a cache; continue without saving it
+        pass
+    return None
+
+
+# This function differences all the cumulative meter columns of a data frame in one pass to get the 30min data.
+# If the previous value is not positive or the difference is negative, the difference is set to NaN.
+# Returns a data frame of the differences with the columns renamed to <column>_30min_avg.
+def _difference_cumulative_(df):
+    values = df.values.astype('float')
+    prev_values = np.vstack([np.full((1, values.shape[1]), np.nan), values[:-1]])
+    with np.errstate(invalid='ignore'):
+        valid = (prev_values > 0) & (values >= prev_values)
+    diff = np.where(valid, values - prev_values, np.nan)
+    return pd.DataFrame(diff, index=df.index, columns=[i + '_30min_avg' for i in df.columns])
+
+
+# This function decoompose a building formula into its components.
+# Each formula is the difference of 2 lists which are summed : [summadd] - [sumsubstract]
+# Each list comprises attributes (e.g. PWMSDE3IC1) and additive modifiers (a constant e.g. 9578551)
+# Each attribute can also be a list [attr, multiplicative modifier]. In such cases, the value of the
+# attribute is multiplied by the modifier which is a numerical constant.
+# E.g. [["BTUE5_30min_avg", 3465519], [["BTULT3&4_30min_avg", 0.5], "BTUCompCenter_30min_avg"]] is
+# (BTUE5_30min_avg + 3465519) - (BTULT3&4_30min_avg * 0.5 + BTUCompCenter_30min_avg)
+def _decompose_formula_(df, attr_list):
+    pwm_add_idx, pwm_add_add_mods, pwm_add_multi_mods = [], [], []
+    for j in attr_list:
+        if isinstance(j, int) or isinstance(j, float):
+            pwm_add_add_mods.append(j)
+        elif isinstance(j, list):
+            pwm_add_idx.append(df.columns.get_loc(j[0]))
+            pwm_add_multi_mods.append(j[1])
+        else:
+            pwm_add_idx.append(df.columns.get_loc(j))
+            pwm_add_multi_mods.append(1.0)
+    return pwm_add_idx, pwm_add_add_mods, pwm_add_multi_mods
+
+
+# This function compiles a building formula [[sumadd], [sumsubtract]] into a coefficient matrix with one column per
+# term (sumadd, sumsubtract). It returns:
+# col_idx - the indices of the data frame columns used in the formula
+# coef_matrix - multiplicative modifiers; coef_matrix[i, j] is the coefficient of column col_idx[i] in term j
+# term_matrix - True if column col_idx[i] is an attribute of term j (also for zero modifiers)
+# offsets - the sum of the additive modifiers of each term
+# Raises KeyError if an attribute is not a column of the data frame.
+def _compile_formula_(df, formula):
+    terms = [_decompose_formula_(df, attr_list) for attr_list in formula]
+
+    col_idx = []
+    for idx, add_mods, multi_mods in terms:
+        for i in idx:
+            if i not in col_idx:
+                col_idx.append(i)
+
+    coef_matrix = np.zeros((len(col_idx), len(terms)))
+    term_matrix = np.zeros((len(col_idx), len(terms)), dtype=bool)
+    offsets = np.zeros(len(terms))
+    for j, (idx, add_mods, multi_mods) in enumerate(terms):
+        for i, multi_mod in zip(idx, multi_mods):
+            coef_matrix[col_idx.index(i), j] += multi_mod
+            term_matrix[col_idx.index(i), j] = True
+        offsets[j] = sum(add_mods)
+
+    return col_idx, coef_matrix, term_matrix, offsets
+
+
+# This function evaluates a compiled building formula (see _compile_formula_) over all the rows of the data frame.
+# Returns an array with one column per term. A term is NaN if any of its attributes is missing.
+def _eval_formula_(df, col_idx, coef_matrix, term_matrix, offsets):
+    values = df.iloc[:, col_idx].values.astype('float')
+    missing = np.isnan(values)
+    result = np.where(missing, 0., values).dot(coef_matrix) + offsets
+    result[missing.dot(term_matrix)] = np.nan
+    return result
+
+
+# This function returns [PWM formulae, BTU formulae] of all the buildings. The formulae files are read on first use.
+def _get_bldg_formulae_():
+    global _PWM_FORMULA_, _BTU_FORMULA_
+    if _PWM_FORMULA_ is None:
+        with open(_BLDG_PWM_FORMULAE_FILE_) as json_file:
+            _PWM_FORMULA_ = json.load(json_file)
+    if _BTU_FORMULA_ is None:
+        with open(_BLDG_BTU_FORMULAE_FILE_) as json_file:
+            _BTU_FORMULA_ = json.load(json_file)
+    return [_PWM_FORMULA_, _BTU_FORMULA_]
+
+
+# This function differences the cumulative data of a building (reindexed to 30min periods) and calculates the
+# aggregate PWM and BTU according to the building formulae. Errors are logged to _MSG_LOG_FILE_ if log_formula_err is
+# True. The negative BTU values are removed; the caller logs their number.
+# Returns [data frame, True if PWM formula error, True if BTU formula error, number of negative BTU values removed]
+def _aggregate_bldg_df_(name, df, log_formula_err=True):
+
+    # Difference the cumulative data to get the 30min data.
+    df = pd.concat([df, _difference_cumulative_(df)], axis=1)
+
+    # Calculate the aggregate PWM according to building formula.
+    pwm_formula, btu_formula = _get_bldg_formulae_()
+    pwm_formula_err = False
+    try:
+        # Compile the building formula into a coefficient matrix and evaluate it over the whole data frame.
+        # See comments in function definition.
+        if not _apply_formula_(df, pwm_formula[name], 'PWM'):
+            if log_formula_err:
+                _write_msg_log_('PWM formula error in %s' % name, log=_MSG_LOG_FILE_)
+            pwm_formula_err = True
+    except KeyError:
+        if log_formula_err:
+            _write_msg_log_('PWM formula error in %s' % name, log=_MSG_LOG_FILE_)
+        pwm_formula_err = True
+
+    # Calculate the aggregate BTU according to building formula. See comments above for PWM calculations.
+    btu_formula_err = False
+    num_negative_btu = 0
+    try:
+        if _apply_formula_(df, btu_formula[name], 'BTU'):
+            # Remove any negative BTU values.
+            is_negative = df['BTU_30min_avg'] < 0
+            df['BTU_30min_avg'] = df['BTU_30min_avg'].mask(is_negative)
+            num_negative_btu = int(is_negative.sum())
+        else:
+            if log_formula_err:
+                _write_msg_log_('BTU formula error in %s' % name, log=_MSG_LOG_FILE_)
+            btu_formula_err = True
+    except KeyError:
+        if log_formula_err:
+            _write_msg_log_('BTU formula error in %s' % name, log=_MSG_LOG_FILE_)
+        btu_formula_err = True
+
+    return df, pwm_formula_err, btu_formula_err, num_negative_btu
+
+
+# This function logs the number of negative BTU values removed from the data of a building, if any.
+def _log_negative_btu_(num_negative_btu, name):
+    if num_negative_btu > 0:
+        _write_msg_log_('%d negative BTU values removed in %s' % (num_negative_btu, name), log=_MSG_LOG_FILE_)
+
+
+# This function processes the combined data of a building like process_data_by_bldg, 1 month at a time.
+# Pass 0 reads the time index of the combined data file to get the start and end of the data.
+# Pass 1 reads the file in chunks of chunk_rows rows and reindexes, differences and aggregates each month. The last
+# row of the previous month is the boundary row for differencing. Each month is saved to a temporary file.
+# The outliers are calculated over the aggregate columns of the whole history, which are the only columns kept in
+# memory; the quartiles are the same as without chunks.
+# Pass 2 removes the outliers from each month and writes the months to the output file.
+# Returns True if the output file is written.
+def _process_bldg_chunked_(name, input_data_path, output_data_path, input_format, output_format, outlier_prefixes,
+                           outlier_k, outlier_window, chunk_rows):
+
+    input_file = _bldg_file_path_(input_data_path, name, input_format)
+    output_file = _bldg_file_path_(output_data_path, name, output_format)
+
+    # Pass 0: the start and end of the reindexed data, as in process_data_by_bldg.
+    index, columns = _read_bldg_index_(input_file, input_format)
+    start = index.min() - MonthBegin(n=1)  # set to first day of month
+    start = start.replace(hour=0, minute=0)  # set time to 00h00
+    end = index.max() + MonthEnd(n=1)  # set to last day of month
+    end = end.replace(hour=23, minute=30)  # set time to 23h30
+
+    temp_dir = '%s.%d.tmp' % (output_file, os.getpid())
+    os.makedirs(temp_dir, exist_ok=True)
+    try:
+        # Pass 1: reindex, difference and aggregate each month.
+        month_files = []
+        outlier_values = {}
+        boundary_df = None
+        formula_errs = None
+        num_negative_btu = 0
+        month_df_iter = _iter_bldg_df_months_(input_file, input_format, index, chunk_rows)
+        next_month, next_month_df = next(month_df_iter, [None, None])
+        for month in pd.period_range(start, end, freq='M'):
+            if month == next_month:
+                month_df = next_month_df.astype('float')
+                next_month, next_month_df = next(month_df_iter, [None, None])
+            else:
+                # no data in the month
+                month_df = pd.DataFrame(index=pd.DatetimeIndex([], name=index.name), columns=columns, dtype='float')
+            month_df = reindex_ts_df(month_df, month.start_time, month.end_time)
+            if boundary_df is not None:
+                month_df = pd.concat([boundary_df, month_df])
+            boundary_df = month_df.iloc[[-1]]
+
+            month_df, pwm_formula_err, btu_formula_err, month_negative_btu = _aggregate_bldg_df_(
+                name, month_df, log_formula_err=formula_errs is None)
+            num_negative_btu += month_negative_btu
+            formula_errs = [['PWM', pwm_formula_err], ['BTU', btu_formula_err]]
+            if pwm_formula_err and btu_formula_err:
+                return False
+            if len(month_files) > 0:
+                # Remove the boundary row which belongs to the previous month.
+                month_df = month_df.iloc[1:]
+
+            for prefix, formula_err in formula_errs:
+                if (not formula_err) and (prefix in outlier_prefixes):
+                    outlier_values.setdefault(prefix, []).append(month_df[prefix + '_30min_avg'])
+            month_files.append(os.path.join(temp_dir, '%s.pkl' % month))
+            month_df.to_pickle(month_files[-1])
+        _log_negative_btu_(num_negative_btu, name)
+
+        # Remove the outliers over the whole history.
+        outlier_cols = {}
+        for prefix, values in outlier_values.items():
+            outlier_cols[prefix + '_30min_avg'], num_outliers = _mask_outliers_(pd.concat(values), outlier_k,
+                                                                                 outlier_window)
+            if num_outliers > 0:
+                _write_msg_log_('%d %s outliers removed in %s' % (num_outliers, prefix, name), log=_MSG_LOG_FILE_)
+
+        # Pass 2: write each month without the outliers.
+        temp_file = os.path.join(temp_dir, os.path.basename(output_file))
+        _write_bldg_df_chunks_(_iter_month_files_(month_files, outlier_cols), temp_file, output_format)
+        os.replace(temp_file, output_file)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return True
+
+
+# This function reads the time index of the time series data of a building from a file in the storage format.
+# Returns [index (not sorted), list of the columns].
+def _read_bldg_index_(file_path, storage_format):
+    if storage_format == 'parquet':
+        from pyarrow import parquet
+        index = pd.read_parquet(file_path, columns=[]).index
+        columns = [i for i in parquet.read_schema(file_path).names if i not in index.names]
+    elif storage_format == 'feather':
+        import pyarrow
+        from pyarrow import feather
+        table = feather.read_table(file_path, columns=[0], memory_map=True)
+        index = pd.DatetimeIndex(table.column(0).to_pandas(), name=table.column_names[0])
+        columns = pyarrow.ipc.open_file(file_path).schema.names[1:]
+    else:
+        index = pd.read_csv(file_path, index_col=0, usecols=[0], parse_dates=True).index
+        columns = list(pd.read_csv(file_path, index_col=0, nrows=0).columns)
+    return [index, columns]
+
+
+# This function reads the time series data of a building from a file in the storage format in chunks of chunk_rows
+# rows, in the order of the file. Yields a data frame indexed by the time stamps for each chunk.
+def _read_bldg_df_chunks_(file_path, storage_format, chunk_rows):
+    if storage_format == 'parquet':
+        from pyarrow import parquet
+        for batch in parquet.ParquetFile(file_path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif storage_format == 'feather':
+        from pyarrow import feather
+        table = feather.read_table(file_path, memory_map=True)
+        for i in range(0, table.num_rows, chunk_rows):
+            df = table.slice(i, chunk_rows).to_pandas()
+            df.set_index(df.columns[0], inplace=True)
+            yield df
+    else:
+        for df in pd.read_csv(file_path, index_col=0, parse_dates=True, chunksize=chunk_rows):
+            yield df
+
+
+# This function reads the time series data of a building from a file in chunks (see _read_bldg_df_chunks_) and
+# yields [month, data frame of the month sorted by time] for each month with data, in time order. index is the time
+# index of the file (see _read_bldg_index_). A month is yielded when all its rows have been read, so the rows of the
+# file do not need to be sorted.
+def _iter_bldg_df_months_(file_path, storage_format, index, chunk_rows):
+    # Position of the last row of each month in the file
+    month_last_rows = pd.Series(np.arange(len(index)), index=index.to_period('M')).groupby(level=0).max().sort_index()
+    month_dfs = {}
+    num_rows = 0
+    month_idx = 0
+    for df in _read_bldg_df_chunks_(file_path, storage_format, chunk_rows):
+        num_rows += len(df)
+        for month, month_df in df.groupby(df.index.to_period('M')):
+            month_dfs.setdefault(month, []).append(month_df)
+        while (month_idx < len(month_last_rows)) and (month_last_rows.iloc[month_idx] < num_rows):
+            month = month_last_rows.index[month_idx]
+            yield [month, pd.concat(month_dfs.pop(month)).sort_index()]
+            month_idx += 1
+
+
+# This function yields the data frame of each month saved by _process_bldg_chunked_, with the columns in
+# outlier_cols replaced by the columns without outliers.
+def _iter_month_files_(month_files, outlier_cols):
+    for month_file in month_files:
+        month_df = pd.read_pickle(month_file)
+        for col, values in outlier_cols.items():
+            month_df[col] = values.loc[month_df.index]
+        yield month_df
+
+
+# This function writes the chunks of the time series data of a building to a file in the storage format, like
+# _write_bldg_df_ would write the concatenated chunks. Only 1 chunk is in memory at a time.
+def _write_bldg_df_chunks_(df_chunks, file_path, storage_format):
+    writer = None
+    try:
+        for i, df in enumerate(df_chunks):
+            if storage_format == 'csv':
+                df.to_csv(file_path, mode='w' if i == 0 else 'a', header=(i == 0))
+                continue
+            import pyarrow
+            if storage_format == 'parquet':
+                from pyarrow import parquet
+                table = pyarrow.Table.from_pandas(df)
+                if writer is None:
+                    writer = parquet.ParquetWriter(file_path, table.schema)
+            else:
+                # Feather does not store the index; it is written as the first column.
+                table = pyarrow.Table.from_pandas(df.reset_index(), preserve_index=False)
+                if writer is None:
+                    writer = pyarrow.ipc.new_file(file_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return None
+
+
+# This function sets the outliers of a series to NaN: the values more than k * IQR below the 1st quartile or above the
+# 3rd quartile. The quartiles are calculated over the whole series if window is None, else over a trailing rolling
+# window (a number of periods or a time offset e.g. '30D') ending at each value. history is the part of the series
+# before it (e.g. already processed); it is included in the quartiles but not masked. Only the last window of the
+# history is used if window is given.
+# Returns [series, number of values set to NaN].
+def _mask_outliers_(series, k=3.0, window=None, history=None):
+    if (history is not None) and (window is not None):
+        if isinstance(window, int):
+            history = history.iloc[max(len(history) - window + 1, 0):]
+        else:
+            history = history[history.index > series.index.min() - pd.tseries.frequencies.to_offset(window)]
+    values = series if history is None else pd.concat([history, series])
+
+    if window is None:
+        q1, q3 = values.quantile(.25), values.quantile(.75)
+    else:
+        rolling_values = values.rolling(window, min_periods=1)
+        q1 = rolling_values.quantile(.25).values[len(values) - len(series):]
+        q3 = rolling_values.quantile(.75).values[len(values) - len(series):]
+    iqr = q3 - q1
+    is_outlier = (series.values > (q3 + iqr * k)) | (series.values < (q1 - iqr * k))
+    return [series.mask(is_outlier), int(is_outlier.sum())]
+
+
+# This function adds the aggregate columns <prefix>_sumadd, <prefix>_sumsubtract (if there are terms to subtract)
+# and <prefix>_30min_avg to the data frame according to the building formula.
+# Returns False if the formula has no terms to add. Raises KeyError if an attribute is not a column of the data frame.
+def _apply_formula_(df, formula, prefix):
+    col_idx, coef_matrix, term_matrix, offsets = _compile_formula_(df, formula)
+    if not term_matrix[:, 0].any():
+        return False
+
+    result = _eval_formula_(df, col_idx, coef_matrix, term_matrix, offsets)
+    df[prefix + '_sumadd'] = result[:, 0]
+    if term_matrix[:, 1].any():
+        df[prefix + '_sumsubtract'] = result[:, 1]
+        df[prefix + '_30min_avg'] = df[prefix + '_sumadd'] - df[prefix + '_sumsubtract']
+    else:
+        # no terms to subtract in formula
+        df[prefix + '_30min_avg'] = df[prefix + '_sumadd']
+    return True
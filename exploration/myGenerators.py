@@ -0,0 +1,406 @@
+######################################################################################################################
+# Import libraries
+######################################################################################################################
+import numpy as np
+from keras.utils import Sequence
+from myWindows import _attach_data_, _floatx_, _max_delay_, _valid_rows_mask_, _window_view_, \
+    _gather_windows_, _get_lane_rows_, _get_cache_key_, _load_cached_arrays_, _save_cached_arrays_, \
+    _encode_batch_idx_, _decode_batch_idx_
+
+
+######################################################################################################################
+# Public Functions
+######################################################################################################################
+
+
+# Generator which yields a batch of data each time it is called.
+# data is an array or the file name of a .npy file (see save_mmap_data).
+# dtype is the dtype of the samples and targets (the keras floatx if None).
+# Only the valid samples are used, with the same rule as the other generators (see _valid_rows_mask_).
+def generator(data, lookback, delay, min_index, max_index,
+              shuffle=False, batch_size=128, step=6, verbose=0, dtype=None):
+    data = _attach_data_(data)
+    dtype = _floatx_(dtype)
+    windows = _window_view_(data, lookback, step)
+    # Set the data max index limit
+    if max_index is None:
+        max_index = len(data) - _max_delay_(delay) - 1
+    else:
+        max_index = max_index - _max_delay_(delay)
+    # Need to exclude the samples which are not valid (see _valid_rows_mask_).
+    all_rows = np.arange(min_index + lookback, max_index + 1)
+    valid_rows = all_rows[_valid_rows_mask_(data, lookback, all_rows, delay)]
+    # Set the current position of the batch start in valid_rows
+    i = 0
+    if verbose:
+        print('\nstarting generator ... %d valid samples\n' % len(valid_rows))
+
+    while 1:
+        if shuffle:
+            # Randomly select a batch from data
+            rows = valid_rows[np.random.randint(len(valid_rows), size=batch_size)]
+        else:
+            if verbose:
+                print('\n batch start index i = %d' % valid_rows[i])
+            # Select a batch starting from i; the last batch may have fewer samples than other batches
+            rows = valid_rows[i:i + batch_size]
+            # If last batch, reset the position to the beginning of data
+            if i + batch_size >= len(valid_rows):
+                i = 0
+            else:
+                # Set the position to the start of next batch of data
+                i += len(rows)
+
+        # Each row in samples is a training sample from t-lookback to t-1.
+        # Each value in targets is a training label at t+delay.
+        samples, targets = _gather_windows_(data, windows, rows, lookback, delay, dtype)
+
+        yield samples, targets
+
+
+# Thread-safe generator which yields a batch of data each time it is called.
+# The samples of a batch are gathered from a strided window view of the data.
+# If reuse_buffers is True, the samples of each batch are written to the same preallocated array. Use it only if each
+# batch is consumed before the next batch is fetched, e.g. with use_multiprocessing=True where the batches are
+# pickled to the main process; the queued batches of a thread worker would be overwritten.
+# data is an array or the file name of a .npy file (see save_mmap_data). A .npy file is memory-mapped and the worker
+# processes map the same file instead of getting a copy of the data.
+# If shuffle is True, the samples are shuffled within each batch and across all the batches at the end of each epoch.
+# seed is the seed of the random number generator used for shuffling.
+# delay is an int or a sequence of horizons e.g. range(1, 49); for a sequence, the targets of a batch are a
+# (batch, horizons) array and the missing outputs are MASK_VALUE (see masked_loss).
+# dtype is the dtype of the samples and targets (the keras floatx if None).
+# If cache is True, the rows of the batches are saved to the generator cache (source/cache) and loaded from it by
+# the next generator with the same data and parameters.
+class DataGenerator(Sequence):
+
+    def __init__(self, data, lookback, delay, min_index, max_index, batch_size=128, step=6, shuffle=False, verbose=0,
+                 reuse_buffers=False, seed=None, dtype=None, cache=False):
+        self.data_file = data if isinstance(data, str) else None
+        data = _attach_data_(data)
+        if max_index is None:
+            self.max_index = len(data) - _max_delay_(delay) - 1
+        else:
+            self.max_index = max_index - _max_delay_(delay)
+        self.min_index = min_index
+        self.data = data
+        self.lookback, self.delay = lookback, delay
+        self.batch_size, self.step = batch_size, step
+        self.shuffle = shuffle
+        self.verbose = verbose
+        self.reuse_buffers = reuse_buffers
+        self.rng = np.random.RandomState(seed)
+        self.dtype = _floatx_(dtype)
+        self.dict_batch_idx = {}
+        self.windows = None
+        self.buffers = {}
+
+        if cache:
+            cache_key = _get_cache_key_(data, 'DataGenerator', [self.lookback, np.array(self.delay).tolist(),
+                                                                self.min_index, self.max_index, self.batch_size])
+            cached_arrays = _load_cached_arrays_(cache_key)
+            if cached_arrays is not None:
+                self.num_batches = int(cached_arrays['num_batches'])
+                self.dict_batch_idx = _decode_batch_idx_(cached_arrays)
+                return
+
+        # Select a batch starting from lookback;
+        # the last batch may have fewer samples than other batches
+        # Note that max_index had already been reduced to account for delay.
+        # Need to exclude the samples which are not valid (see _valid_rows_mask_).
+        batch_start_idx = self.min_index + self.lookback
+        all_rows = np.arange(batch_start_idx, self.max_index + 1)
+        valid_rows = all_rows[_valid_rows_mask_(data, self.lookback, all_rows, self.delay)]
+
+        # Number of batches = valid samples / batch_size. Add 1 if residual samples.
+        self.num_batches = int(np.ceil(len(valid_rows) / self.batch_size))
+        for i in range(self.num_batches):
+            self.dict_batch_idx[i] = valid_rows[i * self.batch_size:(i + 1) * self.batch_size].tolist()
+
+        if cache:
+            _save_cached_arrays_(cache_key, dict(_encode_batch_idx_(self.dict_batch_idx),
+                                                 num_batches=np.array(self.num_batches)))
+
+    def __len__(self):
+        return self.num_batches
+
+    def __getitem__(self, item):
+        if self.verbose:
+            print('\nitem = %d' % item)
+        # Item values are 0 to (__len__ - 1)
+        # rows = np.arange(self.lookback + item * self.batch_size,
+        #                  min(self.lookback + (item + 1) * self.batch_size, self.max_index + 1))
+        rows = np.array(self.dict_batch_idx[item])
+
+        if self.verbose:
+            print('\nbatch start index = %d\nbatch end index = %d' % (min(rows), max(rows)))
+            print('batch size = %d' % len(rows))
+            print(rows)
+        # Shuffle the samples if needed. Only the row indices are shuffled, before the samples are gathered.
+        if self.shuffle:
+            rows = self.rng.permutation(rows)
+        # Each row in samples is a training sample from t-lookback to t-1; it is the window starting at t-lookback.
+        if self.windows is None:
+            self.windows = _window_view_(self.data, self.lookback, self.step)
+        # Each value in targets is a training label at t+delay.
+        if self.reuse_buffers:
+            if len(rows) not in self.buffers:
+                self.buffers[len(rows)] = np.empty((len(rows),) + self.windows.shape[1:], dtype=self.dtype)
+            samples, targets = _gather_windows_(self.data, self.windows, rows, self.lookback, self.delay, self.dtype,
+                                                out=self.buffers[len(rows)])
+        else:
+            samples, targets = _gather_windows_(self.data, self.windows, rows, self.lookback, self.delay, self.dtype)
+
+        return samples, targets
+
+    # Shuffle the samples across all the batches if needed. The number of samples in each batch is unchanged.
+    def on_epoch_end(self):
+        if self.shuffle and self.dict_batch_idx:
+            batch_keys = sorted(self.dict_batch_idx.keys())
+            batch_lens = [len(self.dict_batch_idx[i]) for i in batch_keys]
+            all_rows = self.rng.permutation(np.concatenate([self.dict_batch_idx[i] for i in batch_keys]))
+            for i, rows in zip(batch_keys, np.split(all_rows, np.cumsum(batch_lens)[:-1])):
+                self.dict_batch_idx[i] = rows.tolist()
+
+    # The window view and buffers are not pickled (pickling the view would copy every window); they are created
+    # again in the worker process. Memory-mapped data is mapped again from its file.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['windows'] = None
+        state['buffers'] = {}
+        if self.data_file is not None:
+            state['data'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.data_file is not None:
+            self.data = _attach_data_(self.data_file)
+
+
+# Thread-safe generator which yields a batch of data from the data of many buildings each time it is called.
+# data_list is a list of 2-D arrays, one per building, or a list of [name, array]. The arrays are concatenated and the
+# samples are selected within each building so that the lookback and target of a sample never span 2 buildings.
+# If bldg_id_feature is True, the index of the building in data_list is added as the last feature.
+# If bldg_weights is given (1 weight per building), each epoch has samples_per_epoch samples (the number of samples
+# of all the buildings if None) drawn with replacement; a building is drawn with probability proportional to its
+# weight and a sample is drawn uniformly from the building. Otherwise each epoch has all the samples of all the
+# buildings, shuffled if shuffle is True.
+# seed is the seed of the random number generator used for sampling and shuffling.
+# dtype is the dtype of the samples and targets (the keras floatx if None).
+class PanelDataGenerator(Sequence):
+
+    def __init__(self, data_list, lookback, delay, batch_size=128, step=6, shuffle=False, bldg_id_feature=False,
+                 bldg_weights=None, samples_per_epoch=None, seed=None, verbose=0, dtype=None):
+        self.bldg_names = []
+        bldg_data_list = []
+        for i, data in enumerate(data_list):
+            if isinstance(data, (list, tuple)):
+                self.bldg_names.append(data[0])
+                data = data[1]
+            else:
+                self.bldg_names.append(i)
+            data = np.asarray(data)
+            if bldg_id_feature:
+                data = np.hstack([data, np.full((len(data), 1), i, dtype=data.dtype)])
+            bldg_data_list.append(data)
+        self.data = np.concatenate(bldg_data_list)
+        self.lookback, self.delay = lookback, delay
+        self.batch_size, self.step = batch_size, step
+        self.shuffle = shuffle
+        self.bldg_weights = bldg_weights
+        self.verbose = verbose
+        self.rng = np.random.RandomState(seed)
+        self.dtype = _floatx_(dtype)
+        self.windows = None
+
+        # Get the samples with output and at least 1 output in their lookback in each building.
+        self.bldg_rows = []
+        bldg_start_idx = 0
+        for data in bldg_data_list:
+            all_rows = np.arange(bldg_start_idx + lookback, bldg_start_idx + len(data) - _max_delay_(delay))
+            self.bldg_rows.append(all_rows[_valid_rows_mask_(self.data, lookback, all_rows, delay)])
+            bldg_start_idx += len(data)
+
+        if samples_per_epoch is None:
+            samples_per_epoch = sum([len(rows) for rows in self.bldg_rows])
+        self.samples_per_epoch = samples_per_epoch
+        self.epoch_rows = None
+        self.on_epoch_end()
+
+    def __len__(self):
+        return int(np.ceil(len(self.epoch_rows) / self.batch_size))
+
+    def __getitem__(self, item):
+        rows = self.epoch_rows[item * self.batch_size:(item + 1) * self.batch_size]
+        if self.verbose:
+            print('\nitem = %d, batch size = %d' % (item, len(rows)))
+        if self.windows is None:
+            self.windows = _window_view_(self.data, self.lookback, self.step)
+        # Each row in samples is a training sample from t-lookback to t-1.
+        # Each value in targets is a training label at t+delay.
+        samples, targets = _gather_windows_(self.data, self.windows, rows, self.lookback, self.delay, self.dtype)
+        return samples, targets
+
+    # Select the samples of the next epoch.
+    def on_epoch_end(self):
+        if self.bldg_weights is not None:
+            bldg_prob = np.array(self.bldg_weights, dtype='float') * np.array([len(i) > 0 for i in self.bldg_rows])
+            bldg_prob /= bldg_prob.sum()
+            bldg_idx = self.rng.choice(len(self.bldg_rows), size=self.samples_per_epoch, p=bldg_prob)
+            self.epoch_rows = np.empty(self.samples_per_epoch, dtype='int')
+            for i, rows in enumerate(self.bldg_rows):
+                is_bldg = bldg_idx == i
+                self.epoch_rows[is_bldg] = rows[self.rng.randint(0, max(len(rows), 1), size=is_bldg.sum())]
+        elif self.epoch_rows is None or self.shuffle:
+            self.epoch_rows = np.concatenate(self.bldg_rows)
+            if self.shuffle:
+                self.epoch_rows = self.rng.permutation(self.epoch_rows)
+
+    # The window view is not pickled (pickling the view would copy every window); it is created again in the worker
+    # process.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['windows'] = None
+        return state
+
+
+# For stateful RNN. Thread-safe generator which yields a batch of data each time it is called.
+# Each batch of data will be of the specified batch size.
+# Each batch of data will be made up of contiguous samples.
+# A function will return True if the next batch is not contiguous (which requires reset_state to be called)
+# data is an array or the file name of a .npy file (see save_mmap_data).
+# dtype is the dtype of the samples and targets (the keras floatx if None).
+# If lanes is True, each of the batch_size samples of a batch (a lane) follows its own sequence of contiguous samples
+# instead: sample j of a batch is the sample after sample j of the previous batch, unless lane j starts a new
+# sequence. The sequences are split into lanes of about the same length and no sample is discarded. A lane which has
+# run out of samples is padded with its last sample with a sample weight of 0, so each batch is
+# (samples, targets, sample_weights). Use LaneResetCb to reset the states of the lanes which start a new sequence.
+# If cache is True, the rows of the batches are saved to the generator cache (see DataGenerator).
+class DataGeneratorForStateFulRNN(Sequence):
+
+    def __init__(self, data, lookback, delay, min_index, max_index, batch_size=128, step=6, verbose=0, dtype=None,
+                 lanes=False, cache=False):
+        self.data_file = data if isinstance(data, str) else None
+        data = _attach_data_(data)
+        if max_index is None:
+            self.max_index = len(data) - _max_delay_(delay) - 1
+        else:
+            self.max_index = max_index - _max_delay_(delay)
+        self.min_index = min_index
+        self.data = data
+        self.lookback, self.delay = lookback, delay
+        self.batch_size, self.step = batch_size, step
+        self.verbose = verbose
+        self.dtype = _floatx_(dtype)
+        self.lanes = lanes
+        self.dict_batch_idx = {}
+        self.dict_seq_from_last_batch = {}
+
+        if cache:
+            cache_key = _get_cache_key_(data, 'DataGeneratorForStateFulRNN',
+                                        [self.lookback, np.array(self.delay).tolist(), self.min_index, self.max_index,
+                                         self.batch_size, self.lanes])
+            cached_arrays = _load_cached_arrays_(cache_key)
+            if (cached_arrays is not None) and (not lanes):
+                self.dict_batch_idx = _decode_batch_idx_(cached_arrays)
+                self.dict_seq_from_last_batch = dict(zip(self.dict_batch_idx.keys(),
+                                                         cached_arrays['seq_from_last_batch'].tolist()))
+                return
+
+        if lanes:
+            if cache and (cached_arrays is not None):
+                self.lane_rows, self.lane_resets, self.lane_weights = [cached_arrays['lane_rows'],
+                                                                       cached_arrays['lane_resets'],
+                                                                       cached_arrays['lane_weights']]
+            else:
+                all_rows = np.arange(self.min_index + self.lookback, self.max_index + 1)
+                valid_rows = all_rows[_valid_rows_mask_(data, self.lookback, all_rows, self.delay)]
+                self.lane_rows, self.lane_resets, self.lane_weights = _get_lane_rows_(valid_rows, self.batch_size)
+                if cache:
+                    _save_cached_arrays_(cache_key, {'lane_rows': self.lane_rows, 'lane_resets': self.lane_resets,
+                                                     'lane_weights': self.lane_weights})
+            for i in range(len(self.lane_rows)):
+                self.dict_batch_idx[i] = self.lane_rows[i].tolist()
+                self.dict_seq_from_last_batch[i] = not self.lane_resets[i].any()
+            return
+
+        # Select a batch starting from lookback;
+        # the last batch may have fewer samples than other batches
+        # Note that max_index had already been reduced to account for delay.
+        # Need to exclude the samples which are not valid (see _valid_rows_mask_).
+        batch_start_idx = self.min_index + self.lookback
+        batch_end_idx = batch_start_idx
+        all_rows = np.arange(batch_start_idx, self.max_index + 1)
+        is_valid = np.zeros(self.max_index + 1, dtype='bool')
+        is_valid[all_rows] = _valid_rows_mask_(data, self.lookback, all_rows, self.delay)
+        # for i in range(self.num_batches):
+        remaining_samples = True
+        i = 0
+        while remaining_samples:
+            rows = []
+            seq_from_last_batch = True
+            # for j in range(self.batch_size):
+            while ((len(rows) < self.batch_size) and remaining_samples):
+
+                if not is_valid[batch_end_idx]:
+                    # current sample is not valid, clear batch and fetch next sample
+                    rows = []
+                    seq_from_last_batch = False
+                else:
+                    # found a good sample, add to list
+                    rows.append(batch_end_idx)
+
+                # continue search with next sample
+                if batch_end_idx < self.max_index:
+                    batch_end_idx += 1
+                else:
+                    # no more data
+                    remaining_samples = False
+
+            # Add samples found into the batch.
+            if len(rows) == self.batch_size:
+                self.dict_batch_idx[i] = rows
+                self.dict_seq_from_last_batch[i] = seq_from_last_batch
+                i += 1
+
+        if cache:
+            _save_cached_arrays_(cache_key, dict(_encode_batch_idx_(self.dict_batch_idx), seq_from_last_batch=np.array(
+                [self.dict_seq_from_last_batch[i] for i in sorted(self.dict_batch_idx)], dtype='bool')))
+
+    def __len__(self):
+        return len(self.dict_batch_idx)
+
+    def __getitem__(self, item):
+        rows = self.dict_batch_idx[item]
+        if self.verbose:
+            print('\nbatch number = %d' % item)
+            print('\nbatch start index = %d\nbatch end index = %d' % (min(rows), max(rows)))
+            print('batch size = %d' % len(rows))
+            print(rows)
+        # Each row in samples is a training sample from t-lookback to t-1.
+        # Each value in targets is a training label at t+delay.
+        samples, targets = _gather_windows_(self.data, _window_view_(self.data, self.lookback, self.step),
+                                            np.array(rows), self.lookback, self.delay, self.dtype)
+        if self.lanes:
+            return samples, targets, self.lane_weights[item].astype(self.dtype)
+        return samples, targets
+
+    def __seq_from_last_batch__(self, item):
+        return self.dict_seq_from_last_batch[item]
+
+    # Returns a boolean array which is True for each lane which starts a new sequence in the batch (lanes=True).
+    def __lane_reset_mask__(self, item):
+        return self.lane_resets[item]
+
+    # Memory-mapped data is not pickled; it is mapped again from its file in the worker process.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.data_file is not None:
+            state['data'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.data_file is not None:
+            self.data = _attach_data_(self.data_file)
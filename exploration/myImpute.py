@@ -0,0 +1,247 @@
+######################################################################################################################
+# Import libraries
+######################################################################################################################
+import numpy as np
+import pandas as pd
+
+######################################################################################################################
+# Private Parameters
+######################################################################################################################
+
+# Imputation methods of impute_gaps
+_IMPUTE_METHODS_ = ['kalman', 'ma', 'linear']
+
+# Ratios of the level variance to the observation variance searched by the maximum likelihood estimation of
+# impute_kalman.
+_KALMAN_Q_GRID_ = 10.0 ** np.arange(-4., 2.25, .25)
+
+# Initial variance of the level, which approximates a diffuse initialization.
+_KALMAN_INIT_VAR_ = 1e7
+
+
+######################################################################################################################
+# Public Functions
+######################################################################################################################
+
+
+# This function imputes the missing values of a series, a data frame or an array (time along the first axis; each
+# column is a separate time series) with a weighted moving average of the k values before and after each missing value,
+# like na.ma of the R package imputeTS. weighting is 'exponential' (weight 1/2^d at a distance of d periods), 'linear'
+# (1/(d+1)) or 'simple' (1). The window is widened until it has at least 2 values.
+# Returns the imputed data of the same type as data.
+def impute_ma(data, k=4, weighting='exponential'):
+    values = _to_2d_(data)
+    num_rows = len(values)
+    is_na = np.isnan(values)
+    result = values.copy()
+
+    # Only the missing values are computed; each iteration adds the values at a distance of d periods.
+    rows, cols = np.nonzero(is_na)
+    weighted_sums = np.zeros(len(rows))
+    weight_sums = np.zeros(len(rows))
+    num_values = np.zeros(len(rows), dtype='int')
+    d = 1
+    while (len(rows) > 0) and (d < num_rows):
+        weight = _ma_weight_(d, weighting)
+        for other_rows in [rows - d, rows + d]:
+            has_value = (other_rows >= 0) & (other_rows < num_rows)
+            has_value[has_value] = ~is_na[other_rows[has_value], cols[has_value]]
+            weighted_sums[has_value] += weight * values[other_rows[has_value], cols[has_value]]
+            weight_sums[has_value] += weight
+            num_values[has_value] += 1
+        if d >= k:
+            done = num_values >= 2
+            result[rows[done], cols[done]] = weighted_sums[done] / weight_sums[done]
+            rows, cols = rows[~done], cols[~done]
+            weighted_sums, weight_sums, num_values = weighted_sums[~done], weight_sums[~done], num_values[~done]
+        d += 1
+
+    return _from_2d_(data, result)
+
+
+# This function imputes the missing values of a series, a data frame or an array (see impute_ma) with the smoothed level
+# of a local level model (random walk plus noise), like na.kalman of the R package imputeTS with a structural model.
+# The ratio q of the level variance to the observation variance is estimated by maximum likelihood over _KALMAN_Q_GRID_
+# for each column, unless q is given. The Kalman filter runs over all the columns (and all the ratios) at once.
+# Returns the imputed data of the same type as data.
+def impute_kalman(data, q=None):
+    values = _to_2d_(data)
+    if q is None:
+        log_likelihoods = _local_level_filter_(values, _KALMAN_Q_GRID_[:, np.newaxis])[0]
+        q = _KALMAN_Q_GRID_[np.argmax(log_likelihoods, axis=0)]
+    else:
+        q = np.broadcast_to(np.asarray(q, dtype='float'), values.shape[1:])
+    smoothed_level = _local_level_smoother_(values, q)
+    # The columns without values are not imputed.
+    smoothed_level[:, np.isnan(values).all(axis=0)] = np.nan
+    return _from_2d_(data, np.where(np.isnan(values), smoothed_level, values))
+
+
+# This function imputes the gaps (runs of missing values) of at most max_gap values of a series, a data frame or an
+# array (see impute_ma) and leaves the longer gaps missing, like imputeData in ETL.utils.R.
+# method is one of _IMPUTE_METHODS_ ('ma' is impute_ma(k=4, weighting='exponential') and 'linear' is linear
+# interpolation) or a list of [maximum gap size, method] to impute the gaps of different sizes with different methods
+# e.g. [[1, 'linear'], [3, 'kalman']]. Each method uses all the values of the data.
+# Returns the imputed data of the same type as data.
+def impute_gaps(data, method='kalman', max_gap=3):
+    values = _to_2d_(data)
+    gap_sizes = _gap_sizes_(values)
+    if isinstance(method, str):
+        method = [[max_gap, method]]
+
+    result = values.copy()
+    min_gap_size = 0
+    for max_gap_size, gap_method in sorted(method):
+        max_gap_size = min(max_gap_size, max_gap)
+        in_gaps = (gap_sizes > min_gap_size) & (gap_sizes <= max_gap_size)
+        if in_gaps.any():
+            result[in_gaps] = _impute_(values, gap_method)[in_gaps]
+        min_gap_size = max(min_gap_size, max_gap_size)
+
+    return _from_2d_(data, result)
+
+
+# This function simulates missing data like create.missing in ETL.utils.R for num_trials trials at once: each gap of
+# gap_size values starts after an exponentially distributed number of values (rate is the number of gaps per value,
+# e.g. .05) from the end of the previous gap. seed is a seed or a numpy SeedSequence of the random generator.
+# Returns a boolean array (num_rows, num_trials) which is True for the missing values.
+def create_missing_masks(num_rows, rate, gap_size, num_trials=1, seed=None):
+    mask = np.zeros((num_trials, num_rows), dtype='bool')
+    if rate == 0:
+        return mask.T
+    # Each gap and the values before it span at least gap_size + 1 values.
+    max_gaps = num_rows // (gap_size + 1) + 1
+    intervals = np.ceil(np.random.default_rng(seed).exponential(1. / rate, size=(num_trials, max_gaps)))
+    starts = (np.cumsum(intervals, axis=1) + np.arange(max_gaps) * gap_size).astype('int')
+    positions = starts[:, :, np.newaxis] + np.arange(gap_size)
+    trials = np.broadcast_to(np.arange(num_trials)[:, np.newaxis, np.newaxis], positions.shape)
+    in_data = positions < num_rows
+    mask[trials[in_data], positions[in_data]] = True
+    return mask.T
+
+
+# This function evaluates imputation methods (see _IMPUTE_METHODS_) on a series without missing values: missing data
+# is simulated with create_missing_masks(rate, gap_size, num_trials, seed) and each method imputes all the trials at
+# once.
+# Returns [fraction of missing values of each trial, array (methods, trials) of the RMSE of the imputed values]. The
+# RMSE is NaN for a trial without missing values.
+def evaluate_imputation(values, rate, gap_size, num_trials=100, methods=('kalman', 'ma', 'linear'), seed=None):
+    values = np.asarray(values, dtype='float')
+    mask = create_missing_masks(len(values), rate, gap_size, num_trials, seed)
+    data = np.where(mask, np.nan, values[:, np.newaxis])
+    num_missing = mask.sum(axis=0)
+
+    rmse = np.empty((len(methods), num_trials))
+    for i, method in enumerate(methods):
+        sq_errors = np.where(mask, _impute_(data, method) - values[:, np.newaxis], 0.) ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rmse[i] = np.sqrt(sq_errors.sum(axis=0) / num_missing)
+
+    return [num_missing / len(values), rmse]
+
+
+######################################################################################################################
+# Private Functions
+######################################################################################################################
+# This function returns a 2-D float array copy of a series, a data frame or an array; a 1-D array is 1 column.
+def _to_2d_(data):
+    values = np.array(data, dtype='float')
+    return values.reshape(len(values), -1)
+
+
+# This function returns the 2-D array of values as the same type and shape as data (see _to_2d_).
+def _from_2d_(data, values):
+    if isinstance(data, pd.Series):
+        return pd.Series(values[:, 0], index=data.index, name=data.name)
+    if isinstance(data, pd.DataFrame):
+        return pd.DataFrame(values, index=data.index, columns=data.columns)
+    return values.reshape(np.shape(data))
+
+
+# This function returns an array which has the size of the gap of each missing value and 0 for the other values.
+def _gap_sizes_(values):
+    is_na = np.isnan(values)
+    num_rows, num_cols = values.shape
+    # The missing values of a gap have the same number of values before them; add an offset for each column.
+    gap_ids = np.cumsum(~is_na, axis=0) + np.arange(num_cols) * (num_rows + 1)
+    gap_sizes = np.bincount(gap_ids[is_na], minlength=num_cols * (num_rows + 1))
+    return np.where(is_na, gap_sizes[gap_ids], 0)
+
+
+# This function imputes all the missing values of a 2-D array with a method of _IMPUTE_METHODS_.
+def _impute_(values, method):
+    if method == 'kalman':
+        return impute_kalman(values)
+    if method == 'ma':
+        return impute_ma(values, k=4, weighting='exponential')
+    if method == 'linear':
+        result = values.copy()
+        rows = np.arange(len(values))
+        for col in range(values.shape[1]):
+            has_value = ~np.isnan(values[:, col])
+            if has_value.any():
+                result[:, col] = np.interp(rows, rows[has_value], values[has_value, col])
+        return result
+    raise ValueError('Unknown imputation method %s. Expected one of %s.' % (method, ', '.join(_IMPUTE_METHODS_)))
+
+
+# This function returns the weight of a value at a distance of d periods for impute_ma.
+def _ma_weight_(d, weighting):
+    if weighting == 'exponential':
+        return 1. / 2 ** d
+    if weighting == 'linear':
+        return 1. / (d + 1)
+    if weighting == 'simple':
+        return 1.
+    raise ValueError('Unknown weighting %s. Expected exponential, linear or simple.' % weighting)
+
+
+# This function runs the Kalman filter of a local level model with an observation variance of 1 and a level variance
+# of q over the columns of values. q is broadcast with a row of values e.g. (ratios, 1) to filter each column with
+# each ratio. The observation variance is concentrated out of the likelihood; the values up to the first value of each
+# column initialize the level and are not in the likelihood.
+# Returns [log likelihoods, predicted levels, predicted variances, filtered levels, filtered variances]; the levels
+# and variances are only returned (for each row) if keep_states is True.
+def _local_level_filter_(values, q, keep_states=False):
+    shape = np.broadcast(q, values[0]).shape
+    level = np.zeros(shape)
+    var = np.full(shape, _KALMAN_INIT_VAR_ - q)
+    initialized = np.zeros(shape, dtype='bool')
+    sum_log_f = np.zeros(shape)
+    sum_v2_f = np.zeros(shape)
+    num_obs = np.zeros(shape)
+    states = [np.empty((len(values),) + shape) for _ in range(4)] if keep_states else None
+
+    for t, row in enumerate(values):
+        pred_level, pred_var = level, var + q
+        has_value = ~np.isnan(row)
+        f = pred_var + 1.
+        v = np.where(has_value, row - pred_level, 0.)
+        gain = np.where(has_value, pred_var / f, 0.)
+        in_likelihood = has_value & initialized
+        sum_log_f += np.where(in_likelihood, np.log(f), 0.)
+        sum_v2_f += np.where(in_likelihood, v * v / f, 0.)
+        num_obs += in_likelihood
+        initialized = initialized | has_value
+        level = pred_level + gain * v
+        var = pred_var * (1. - gain)
+        if keep_states:
+            states[0][t], states[1][t], states[2][t], states[3][t] = pred_level, pred_var, level, var
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_likelihoods = -0.5 * (sum_log_f + num_obs * np.log(sum_v2_f / num_obs))
+    log_likelihoods = np.where(num_obs > 0, log_likelihoods, -np.inf)
+    if keep_states:
+        return [log_likelihoods] + states
+    return [log_likelihoods, None, None, None, None]
+
+
+# This function returns the smoothed levels of a local level model with the ratios q (1 per column) for each value
+# (fixed interval smoother).
+def _local_level_smoother_(values, q):
+    _, pred_levels, pred_vars, levels, level_vars = _local_level_filter_(values, q, keep_states=True)
+    smoothed_levels = levels.copy()
+    for t in range(len(values) - 2, -1, -1):
+        gain = level_vars[t] / pred_vars[t + 1]
+        smoothed_levels[t] = levels[t] + gain * (smoothed_levels[t + 1] - pred_levels[t + 1])
+    return smoothed_levels
@@ -0,0 +1,87 @@
+######################################################################################################################
+# Import libraries
+######################################################################################################################
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+from myWindows import MASK_VALUE
+
+
+######################################################################################################################
+# Public Functions
+######################################################################################################################
+
+
+# This class selects the desired attributes and drops the rest, and converts the DataFrame to a Numpy array.
+class DataFrameSelector(BaseEstimator, TransformerMixin):
+
+    def __init__(self, attribute_names):
+        self.attribute_names = attribute_names
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        return X[self.attribute_names].values
+
+    def inverse_transform(self, X):
+        return X
+
+
+# This class converts all NaN to a specified numerical value.
+# If copy is False, the NaN are replaced in X itself when X is an array of the dtype. dtype is the dtype of the
+# returned array e.g. 'float32' (the dtype of X if None).
+class Nan_to_Num_Transformer(BaseEstimator, TransformerMixin):
+
+    def __init__(self, num = -1, copy=True, dtype=None):
+        self.num = num
+        self.copy = copy
+        self.dtype = dtype
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        if self.copy:
+            X = np.array(X, dtype=self.dtype)
+        else:
+            X = np.asarray(X, dtype=self.dtype)
+        X[np.isnan(X)] = self.num
+        return X
+
+    def inverse_transform(self, X):
+        return X
+
+
+# This class combines DataFrameSelector, an optional scaler (e.g. MinMaxScaler) and Nan_to_Num_Transformer. It selects
+# the desired attributes into a new C-contiguous array of the dtype, scales the array in place and converts all NaN
+# to num. It can be used on its own or as a step of a Pipeline.
+class DataFrame_to_Array_Transformer(BaseEstimator, TransformerMixin):
+
+    def __init__(self, attribute_names, scaler=None, num=MASK_VALUE, dtype='float32'):
+        self.attribute_names = attribute_names
+        self.scaler = scaler
+        self.num = num
+        self.dtype = dtype
+
+    def fit(self, X, y=None):
+        if self.scaler is not None:
+            self.scaler.fit(np.asarray(X[self.attribute_names].values, dtype=self.dtype))
+        return self
+
+    def transform(self, X):
+        X = np.array(X[self.attribute_names].values, dtype=self.dtype, order='C')
+        if self.scaler is not None:
+            if hasattr(self.scaler, 'min_') and hasattr(self.scaler, 'scale_'):
+                # MinMaxScaler; scale in place
+                X *= self.scaler.scale_
+                X += self.scaler.min_
+            else:
+                X = np.ascontiguousarray(self.scaler.transform(X), dtype=self.dtype)
+        X[np.isnan(X)] = self.num
+        return X
+
+    # Returns the unscaled values of an array; the NaN are not restored.
+    def inverse_transform(self, X):
+        if self.scaler is not None:
+            return self.scaler.inverse_transform(X)
+        return X
@@ -0,0 +1,352 @@
+######################################################################################################################
+# Import libraries
+######################################################################################################################
+import os
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+import hashlib
+
+######################################################################################################################
+# Public Parameters
+######################################################################################################################
+
+# Mask value for missing data
+MASK_VALUE = -1
+
+######################################################################################################################
+# Private Parameters
+######################################################################################################################
+
+# directories
+_GENERATOR_CACHE_PATH_ = os.path.join('source', 'cache')
+
+# Maximum total size in bytes of the files in the generator cache. The least recently used files are removed first.
+_GENERATOR_CACHE_MAX_SIZE_ = 1024 ** 3
+
+# Version of the rows saved in the generator cache; the cached rows of an older version (e.g. another rule for the
+# valid samples) are not used.
+_GENERATOR_CACHE_VERSION_ = 2
+
+
+######################################################################################################################
+# Public Functions
+######################################################################################################################
+
+
+# This function returns separates the data into sequences of contiguous samples in multiples of mini-batch size.
+# Each sequence can then be given as input to evaluate() or predict() of a stateful model.
+# Only the valid samples are used, with the same rule as the generators (see _valid_rows_mask_).
+# data is an array or the file name of a .npy file (see save_mmap_data).
+# Returns [batch_list, rows_list]; batch_list is a list of [samples, targets] for each sequence and rows_list is the
+# list of rows of each sequence. If lazy is True, batch_list is a ContiguousBatchList which creates the samples of a
+# sequence only when it is accessed, and rows_list is a list of range.
+# dtype is the dtype of the samples and targets (the keras floatx if None).
+# If cache is True, the rows of the sequences are saved to the generator cache (see DataGenerator). If cache is
+# 'windows', the samples and targets of the sequences are also saved (only if lazy is False).
+def get_contiguous_batches(data, lookback, delay, min_index, max_index, batch_size=128, step=6, lazy=False,
+                           dtype=None, cache=False):
+    data = _attach_data_(data)
+    # Set the data max index limit to account for delay, like the generators.
+    if max_index is None:
+        max_index = len(data) - _max_delay_(delay) - 1
+    else:
+        max_index = max_index - _max_delay_(delay)
+
+    if cache:
+        cache_key = _get_cache_key_(data, 'get_contiguous_batches', [lookback, np.array(delay).tolist(), min_index,
+                                                                     max_index, batch_size])
+        cached_arrays = _load_cached_arrays_(cache_key)
+        if cached_arrays is not None:
+            rows_list = [range(start, stop) for start, stop in zip(cached_arrays['starts'].tolist(),
+                                                                   cached_arrays['stops'].tolist())]
+        else:
+            rows_list = _get_contiguous_rows_(data, lookback, delay, min_index, max_index, batch_size)
+            _save_cached_arrays_(cache_key, {'starts': np.array([rows.start for rows in rows_list], dtype='int'),
+                                             'stops': np.array([rows.stop for rows in rows_list], dtype='int')})
+    else:
+        rows_list = _get_contiguous_rows_(data, lookback, delay, min_index, max_index, batch_size)
+    batch_list = ContiguousBatchList(data, rows_list, lookback, delay, step, dtype)
+    if lazy:
+        return batch_list, rows_list
+    if cache == 'windows':
+        batch_list = _get_cached_windows_(data, batch_list, cache_key)
+    return list(batch_list), [list(rows) for rows in rows_list]
+
+
+# This class is a list of [samples, targets] for sequences of contiguous samples (see get_contiguous_batches).
+# Only the rows of each sequence are kept; the samples and targets of a sequence are created when it is accessed.
+class ContiguousBatchList(object):
+
+    def __init__(self, data, rows_list, lookback, delay, step=6, dtype=None):
+        self.data = data
+        self.rows_list = rows_list
+        self.lookback, self.delay, self.step = lookback, delay, step
+        self.dtype = _floatx_(dtype)
+
+    def __len__(self):
+        return len(self.rows_list)
+
+    def __getitem__(self, item):
+        rows = np.array(self.rows_list[item])
+        # Each row in samples is a training sample from t-lookback to t-1.
+        # Each value in targets is a training label at t+delay.
+        samples, targets = _gather_windows_(self.data, _window_view_(self.data, self.lookback, self.step), rows,
+                                            self.lookback, self.delay, self.dtype)
+        return [samples, targets]
+
+    def __iter__(self):
+        for item in range(len(self)):
+            yield self[item]
+
+
+# This function saves the data array to a .npy file which can be given as the data of the generators, e.g. to share
+# the data between the worker processes of fit_generator(use_multiprocessing=True) instead of copying it.
+# Returns the file name.
+def save_mmap_data(data, file_name):
+    if not file_name.endswith('.npy'):
+        file_name += '.npy'
+    np.save(file_name, np.ascontiguousarray(data))
+    return file_name
+
+
+######################################################################################################################
+# Private Functions
+######################################################################################################################
+# This function splits the rows into sequences of contiguous rows and assigns the sequences to batch_size lanes
+# (see DataGeneratorForStateFulRNN). A sequence longer than ceil(len(rows) / batch_size) is split, and each sequence
+# is assigned to the lane with the fewest rows, from the longest sequence to the shortest.
+# Returns [lane_rows, lane_resets, lane_weights], 3 (batches, batch_size) arrays: the row of each lane in each batch,
+# True if the lane starts a sequence in the batch, and 0 for the padding at the end of a lane (1 otherwise).
+def _get_lane_rows_(rows, batch_size):
+    if len(rows) == 0:
+        return [np.empty((0, batch_size), dtype='int'), np.empty((0, batch_size), dtype='bool'),
+                np.empty((0, batch_size))]
+    max_seq_len = int(np.ceil(len(rows) / batch_size))
+    seq_starts = np.flatnonzero(np.diff(rows, prepend=rows[0] - 2) != 1)
+    seq_ends = np.append(seq_starts[1:], len(rows))
+    seqs = []
+    for start, end in zip(seq_starts, seq_ends):
+        for i in range(start, end, max_seq_len):
+            seqs.append(rows[i:min(i + max_seq_len, end)])
+
+    lanes = [[] for _ in range(batch_size)]
+    lane_lens = np.zeros(batch_size, dtype='int')
+    for seq in sorted(seqs, key=len, reverse=True):
+        lane = np.argmin(lane_lens)
+        lanes[lane].append(seq)
+        lane_lens[lane] += len(seq)
+
+    num_batches = lane_lens.max()
+    lane_rows = np.full((num_batches, batch_size), rows[0])
+    lane_resets = np.zeros((num_batches, batch_size), dtype='bool')
+    lane_weights = np.zeros((num_batches, batch_size))
+    for lane, lane_seqs in enumerate(lanes):
+        lane_seqs.sort(key=lambda seq: seq[0])
+        i = 0
+        for seq in lane_seqs:
+            lane_rows[i:i + len(seq), lane] = seq
+            lane_resets[i, lane] = True
+            i += len(seq)
+        lane_weights[:i, lane] = 1
+        if i > 0:
+            lane_rows[i:, lane] = lane_rows[i - 1, lane]
+    return [lane_rows, lane_resets, lane_weights]
+
+
+# This function returns the list of [samples, targets] of the ContiguousBatchList from the generator cache, and saves
+# them to the cache if they are not in it. rows_key is the cache key of the rows of the sequences.
+def _get_cached_windows_(data, batch_list, rows_key):
+    cache_key = _get_cache_key_(data, 'windows', [rows_key, batch_list.lookback, np.array(batch_list.delay).tolist(),
+                                                  batch_list.step, str(np.dtype(batch_list.dtype))])
+    cached_arrays = _load_cached_arrays_(cache_key)
+    if cached_arrays is None:
+        batch_list = list(batch_list)
+        if len(batch_list) == 0:
+            return batch_list
+        cached_arrays = {'samples': np.concatenate([a_batch[0] for a_batch in batch_list]),
+                         'targets': np.concatenate([a_batch[1] for a_batch in batch_list])}
+        _save_cached_arrays_(cache_key, cached_arrays)
+        return batch_list
+    split_idx = np.cumsum([len(rows) for rows in batch_list.rows_list])[:-1]
+    return [list(a_batch) for a_batch in zip(np.split(cached_arrays['samples'], split_idx),
+                                             np.split(cached_arrays['targets'], split_idx))]
+
+
+# This function returns the rows of the sequences of contiguous samples in multiples of mini-batch size
+# (see get_contiguous_batches) as a list of range.
+def _get_contiguous_rows_(data, lookback, delay, min_index, max_index, batch_size):
+
+    rows_list = []
+
+    # Select a batch starting from lookback;
+    # Note that max_index had already been reduced to account for delay.
+    # Need to exclude the samples which are not valid (see _valid_rows_mask_).
+    batch_start_idx = min_index + lookback
+    is_invalid = np.ones(max_index + 1, dtype='bool')
+    all_rows = np.arange(batch_start_idx, max_index + 1)
+    is_invalid[all_rows] = ~_valid_rows_mask_(data, lookback, all_rows, delay)
+    batch_end_idx = batch_start_idx
+    remaining_samples = True
+    while remaining_samples:
+        not_na = True
+        # search for the next missing value
+        while remaining_samples and not_na:
+
+            if is_invalid[batch_end_idx]:
+                not_na = False
+            else:
+                # continue search with next sample
+                if batch_end_idx < max_index:
+                    batch_end_idx += 1
+                else:
+                    # no more data
+                    remaining_samples = False
+
+        # Add samples found into the batch if greater than batch size.
+        if batch_end_idx > batch_start_idx + batch_size:
+
+            resid = (batch_end_idx - batch_start_idx) % batch_size
+            rows_list.append(range(batch_start_idx, batch_end_idx - resid))
+            batch_start_idx = batch_end_idx + 1
+
+        # look for the next good value
+        if remaining_samples:
+            # Skip all the nan
+            while is_invalid[batch_end_idx] and (batch_end_idx < max_index):
+                batch_end_idx += 1
+
+            # Check if at end of data
+            if batch_end_idx == max_index:
+                remaining_samples = False
+
+            # Restart from this good value
+            batch_start_idx = batch_end_idx
+
+    return rows_list
+
+
+# This function returns the key of the generator cache for the data and the parameters which determine the cached
+# arrays: kind and a hash of the content, shape and dtype of the data and of the parameters.
+def _get_cache_key_(data, kind, params):
+    data_hash = hashlib.sha1(repr([_GENERATOR_CACHE_VERSION_, data.shape, str(data.dtype), params]).encode())
+    data_hash.update(np.ascontiguousarray(data).reshape(-1).view(np.uint8))
+    return '%s-%s' % (kind, data_hash.hexdigest())
+
+
+# This function returns the dict of arrays saved in the generator cache with the key, or None if it is not cached.
+# The file is marked as recently used.
+def _load_cached_arrays_(key):
+    file_name = os.path.join(_GENERATOR_CACHE_PATH_, key + '.npz')
+    try:
+        with np.load(file_name) as npz_file:
+            arrays = dict(npz_file)
+        os.utime(file_name)
+    except (IOError, ValueError):
+        return None
+    return arrays
+
+
+# This function saves the dict of arrays in the generator cache with the key, then removes the least recently used
+# files until the cache is within _GENERATOR_CACHE_MAX_SIZE_.
+def _save_cached_arrays_(key, arrays):
+    file_name = os.path.join(_GENERATOR_CACHE_PATH_, key + '.npz')
+    temp_file_name = '%s.%d.tmp' % (file_name, os.getpid())
+    try:
+        os.makedirs(_GENERATOR_CACHE_PATH_, exist_ok=True)
+        with open(temp_file_name, 'wb') as npz_file:
+            np.savez(npz_file, **arrays)
+        os.replace(temp_file_name, file_name)
+
+        cache_files = []
+        for cache_file_name in os.listdir(_GENERATOR_CACHE_PATH_):
+            if cache_file_name.endswith('.npz'):
+                cache_file_name = os.path.join(_GENERATOR_CACHE_PATH_, cache_file_name)
+                cache_files.append([os.path.getmtime(cache_file_name), os.path.getsize(cache_file_name),
+                                    cache_file_name])
+        cache_size = sum([size for _, size, _ in cache_files])
+        for _, size, cache_file_name in sorted(cache_files):
+            if cache_size <= _GENERATOR_CACHE_MAX_SIZE_:
+                break
+            os.remove(cache_file_name)
+            cache_size -= size
+    except (IOError, OSError):
+        # the files are only a cache; continue without saving
+        pass
+    return None
+
+
+# This function returns the rows of a dict of batch rows {batch: rows} as arrays to save in the generator cache.
+def _encode_batch_idx_(dict_batch_idx):
+    keys = sorted(dict_batch_idx)
+    return {'keys': np.array(keys, dtype='int'),
+            'lens': np.array([len(dict_batch_idx[i]) for i in keys], dtype='int'),
+            'rows': np.array([row for i in keys for row in dict_batch_idx[i]], dtype='int')}
+
+
+# This function returns the dict of batch rows {batch: rows} from the arrays of _encode_batch_idx_.
+def _decode_batch_idx_(arrays):
+    split_idx = np.cumsum(arrays['lens'])[:-1]
+    return {key: rows.tolist() for key, rows in zip(arrays['keys'].tolist(), np.split(arrays['rows'], split_idx))}
+
+
+# This function returns the data array. If data is the file name of a .npy file, the file is memory-mapped read-only
+# so that all the processes using the file share the same pages.
+def _attach_data_(data):
+    if isinstance(data, str):
+        return np.load(data, mmap_mode='r')
+    return data
+
+
+# This function returns a boolean array which is True for each valid sample (row t in rows). This is the rule of all
+# the generators and get_contiguous_batches: a sample is valid if it has at least 1 target (data[t+d, 0] is not
+# MASK_VALUE for a horizon d of delay; an int delay is 1 horizon) and at least 1 output in its lookback
+# data[t-lookback:t, 0]. The missing targets of the other horizons are left as MASK_VALUE (see masked_loss).
+# rows must be >= lookback and <= len(data) - 1 - the largest horizon.
+def _valid_rows_mask_(data, lookback, rows, delay):
+    has_output = data[:, 0] != MASK_VALUE
+    # num_outputs[t] is the number of outputs in data[0:t, 0]
+    num_outputs = np.concatenate([[0], np.cumsum(has_output)])
+    has_lookback = (num_outputs[rows] - num_outputs[rows - lookback]) > 0
+    has_target = has_output[np.add.outer(rows, np.atleast_1d(delay))].any(axis=1)
+    return has_target & has_lookback
+
+
+# This function returns a read-only view of the data with the window of samples data[t-lookback:t:step] at position
+# t-lookback, for t = lookback to len(data). No data is copied. lookback must be a multiple of step.
+def _window_view_(data, lookback, step):
+    num_windows = data.shape[0] - lookback + 1
+    return as_strided(data, shape=(num_windows, lookback // step) + data.shape[1:],
+                      strides=(data.strides[0], data.strides[0] * step) + data.strides[1:], writeable=False)
+
+
+# This function gathers the samples data[t-lookback:t:step] and the targets data[t+delay, 0] of the rows t from the
+# window view of the data (see _window_view_) into new arrays of the dtype. The samples are written to out if given.
+# If delay is a sequence of horizons, the targets are a (rows, horizons) array.
+# The samples are copied in one pass if the data is already of the dtype e.g. Nan_to_Num_Transformer(dtype='float32').
+def _gather_windows_(data, windows, rows, lookback, delay, dtype, out=None):
+    if out is None:
+        samples = windows[rows - lookback].astype(dtype, copy=False)
+    elif out.dtype == windows.dtype:
+        samples = np.take(windows, rows - lookback, axis=0, out=out, mode='clip')
+    else:
+        samples = out
+        samples[...] = windows[rows - lookback]
+    if np.ndim(delay) == 0:
+        targets = data[rows + delay, 0].astype(dtype)
+    else:
+        targets = data[np.add.outer(rows, delay), 0].astype(dtype)
+    return samples, targets
+
+
+# This function returns the largest horizon of delay, which is an int or a sequence of horizons.
+def _max_delay_(delay):
+    return int(np.max(delay))
+
+
+# This function returns the dtype of the generated samples and targets; the keras floatx if dtype is None.
+def _floatx_(dtype):
+    if dtype is None:
+        # keras is only imported when the dtype is not given.
+        from keras import backend as K
+        return K.floatx()
+    return dtype
@@ -0,0 +1,49 @@
+######################################################################################################################
+# Import libraries
+######################################################################################################################
+import numpy as np
+import pandas as pd
+from myETL import is_day_first
+
+# Tests of the detection of the day first dates of a raw file (is_day_first).
+# Usage: python -m pytest test_day_first.py
+
+######################################################################################################################
+# Private Parameters
+######################################################################################################################
+
+_FILE_NAME_ = 'AS5_Jul2015.csv'
+
+
+######################################################################################################################
+# Public Functions
+######################################################################################################################
+
+
+def test_month_first():
+    assert is_day_first(_FILE_NAME_, _make_df_(['07/01/2015 00:00', '07/13/2015 00:00'])) == (False, False)
+
+
+def test_day_first():
+    assert is_day_first(_FILE_NAME_, _make_df_(['01/07/2015 00:00', '13/07/2015 00:00'])) == (True, False)
+
+
+def test_ambiguous():
+    assert is_day_first(_FILE_NAME_, _make_df_(['07/07/2015 00:00'])) == (False, True)
+    assert is_day_first(_FILE_NAME_, _make_df_([])) == (False, True)
+
+
+def test_rows_without_date_numbers():
+    # The rows without 2 leading numbers (a missing date, an ISO date or a text row) are ignored.
+    for other_row in [np.nan, '2015-07-01 00:00', 'Pt_timeStamp']:
+        assert is_day_first(_FILE_NAME_, _make_df_([other_row, '07/13/2015 00:00'])) == (False, False)
+        assert is_day_first(_FILE_NAME_, _make_df_([other_row, '13/07/2015 00:00'])) == (True, False)
+        assert is_day_first(_FILE_NAME_, _make_df_([other_row, '07/07/2015 00:00'])) == (False, True)
+
+
+######################################################################################################################
+# Private Functions
+######################################################################################################################
+# This function returns a data frame of raw data with the date field of each row.
+def _make_df_(timestamps):
+    return pd.DataFrame({'Pt_timeStamp': timestamps, 'PWM': np.arange(len(timestamps), dtype='float')})
@@ -0,0 +1,104 @@
+######################################################################################################################
+# Import libraries
+######################################################################################################################
+import numpy as np
+import pandas as pd
+import pytest
+from myETL import _apply_formula_, _decompose_formula_
+
+# Equivalence tests of the building formulae evaluated as a masked matrix product (_apply_formula_) against the
+# row-wise apply() of process_data_by_bldg before it was vectorized.
+# Usage: python -m pytest test_formula.py
+
+######################################################################################################################
+# Private Parameters
+######################################################################################################################
+
+_COLUMNS_ = ['PWMA_30min_avg', 'PWMB_30min_avg', 'PWMC_30min_avg', 'BTUX_30min_avg']
+
+
+######################################################################################################################
+# Public Functions
+######################################################################################################################
+
+
+def test_nan_inputs():
+    _check_formula_([['PWMA_30min_avg', 'PWMB_30min_avg'], ['PWMC_30min_avg']], _make_df_(nan_ratio=.2))
+
+
+def test_all_nan_attribute():
+    df = _make_df_()
+    df['PWMB_30min_avg'] = np.nan
+    _check_formula_([['PWMA_30min_avg', 'PWMB_30min_avg'], ['PWMC_30min_avg']], df)
+    _check_formula_([['PWMA_30min_avg'], ['PWMB_30min_avg']], df)
+
+
+def test_zero_and_fractional_modifiers():
+    _check_formula_([[['PWMA_30min_avg', 0], ['PWMB_30min_avg', 0.5], 'PWMC_30min_avg', 1234.5],
+                     [['PWMC_30min_avg', -0.25], ['BTUX_30min_avg', 0.0]]], _make_df_())
+
+
+def test_constant_only_terms():
+    # A subtract term with only constants is ignored like no terms to subtract.
+    _check_formula_([['PWMA_30min_avg', 100], [50]], _make_df_())
+    _check_formula_([['PWMA_30min_avg', 9578551, -25.5], [7, 0.5]], _make_df_())
+    # An add term with only constants is a formula error.
+    _check_formula_([[100], ['PWMA_30min_avg']], _make_df_())
+    _check_formula_([[], []], _make_df_())
+
+
+def test_no_subtract_terms():
+    _check_formula_([['PWMA_30min_avg', ['PWMB_30min_avg', 2.]], []], _make_df_())
+    _check_formula_([['BTUX_30min_avg'], []], _make_df_())
+
+
+def test_repeated_attributes():
+    _check_formula_([['PWMA_30min_avg', 'PWMA_30min_avg', ['PWMB_30min_avg', 0.5]],
+                     ['PWMB_30min_avg', ['PWMA_30min_avg', 0.1]]], _make_df_())
+
+
+def test_missing_attribute():
+    for apply_formula in [_apply_formula_, _apply_formula_row_wise_]:
+        with pytest.raises(KeyError):
+            apply_formula(_make_df_(), [['PWMA_30min_avg', 'PWMZ_30min_avg'], []], 'PWM')
+
+
+######################################################################################################################
+# Private Functions
+######################################################################################################################
+# This function returns a data frame of random 30min data with a ratio of missing values in each column.
+def _make_df_(num_rows=500, nan_ratio=.1, seed=0):
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame(rng.uniform(0, 1000, size=(num_rows, len(_COLUMNS_))), columns=_COLUMNS_,
+                      index=pd.date_range('2015-07-01', periods=num_rows, freq='30min'))
+    return df.mask(rng.uniform(size=df.shape) < nan_ratio)
+
+
+# This function checks that _apply_formula_ and the row-wise reference return the same result and add the same
+# columns to copies of the data frame.
+def _check_formula_(formula, df):
+    df_vectorized, df_row_wise = df.copy(), df.copy()
+    assert _apply_formula_(df_vectorized, formula, 'PWM') == _apply_formula_row_wise_(df_row_wise, formula, 'PWM')
+    pd.testing.assert_frame_equal(df_vectorized, df_row_wise)
+
+
+# This function is the row-wise apply() of process_data_by_bldg before it was vectorized, with the same return value
+# as _apply_formula_.
+def _apply_formula_row_wise_(df, formula, prefix):
+    add_idx, add_add_mods, add_multi_mods = _decompose_formula_(df, formula[0])
+    subtract_idx, subtract_add_mods, subtract_multi_mods = _decompose_formula_(df, formula[1])
+    if not add_idx:
+        return False
+
+    df[prefix + '_sumadd'] = df.iloc[:, add_idx].apply(
+        lambda x: np.nan if x.isnull().any() else (
+                (x * np.array(add_multi_mods)).sum() + sum(add_add_mods)), axis=1)
+    if subtract_idx:
+        df[prefix + '_sumsubtract'] = df.iloc[:, subtract_idx].apply(
+            lambda x: np.nan if x.isnull().any() else (
+                    (x * np.array(subtract_multi_mods)).sum() + sum(subtract_add_mods)), axis=1)
+        df[prefix + '_30min_avg'] = df[prefix + '_sumadd'] - df[prefix + '_sumsubtract']
+    else:
+        # no terms to subtract in formula
+        df[prefix + '_30min_avg'] = df[prefix + '_sumadd']
+    return True